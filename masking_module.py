@@ -1,9 +1,18 @@
 import os
+import re
+import json
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
 import torch
 import numpy as np
 import pandas as pd
-from typing import List, Dict
-from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional
+from dataclasses import dataclass, field, replace
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -13,11 +22,13 @@ from peft import PeftModel
 
 # Copula 모델용 (2단계)
 from copulas.multivariate import GaussianMultivariate
+from scipy.special import ndtr
+from scipy.sparse import csr_matrix
 
 # ================== 데이터 구조 정의 ==================
 @dataclass
 class NERResult:
-    """1단계 NER 결과"""
+    """1단계 NER 결과 (start_pos/end_pos는 원문 기준 문자 위치)"""
     token: str
     entity: str
     start_pos: int = 0
@@ -31,6 +42,8 @@ class RiskWeight:
     category: str  # '직접', '간접', '기타'
     risk_weight: int  # 0-100
     copula_feature: str = None
+    start_pos: int = 0
+    end_pos: int = 0
 
 @dataclass
 class MaskingResult:
@@ -40,14 +53,204 @@ class MaskingResult:
     masking_log: List[Dict]
     total_entities: int
     masked_entities: int
+    # (마스킹 텍스트 시작, 끝, 원문 시작, 끝) 구간 목록
+    position_map: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    # 단계별 소요 시간(ms), 'total'은 요청 전체
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+
+    def to_original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """마스킹된 텍스트의 [start, end) 구간을 원문 위치로 변환"""
+        return self._map_position(start, is_end=False), self._map_position(end, is_end=True)
+
+    def _map_position(self, pos: int, is_end: bool) -> int:
+        if not self.position_map:
+            return pos
+        out_starts = [seg[0] for seg in self.position_map]
+        i = max(bisect.bisect_right(out_starts, pos) - 1, 0)
+        if is_end and i > 0 and pos == self.position_map[i][0]:
+            i -= 1
+        out_start, out_end, in_start, in_end = self.position_map[i]
+        if out_end - out_start == in_end - in_start:
+            # 변경되지 않은 구간은 1:1 대응
+            return in_start + min(pos - out_start, in_end - in_start)
+        # 마스킹 토큰 내부 위치는 원 개체 전체로 대응
+        return in_end if is_end else in_start
+
+# ================== 공통: 다중 키워드 매칭 ==================
+class KeywordAutomaton:
+    """Aho-Corasick 다중 패턴 매칭 오토마톤
+
+    키워드 수와 무관하게 텍스트를 한 번만 훑어 모든 키워드 등장 위치를 찾는다.
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._word = [None]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def __len__(self):
+        return sum(1 for w in self._word if w is not None)
+
+    def _add(self, keyword: str):
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._word.append(None)
+            state = nxt
+        if self._word[state] is None:
+            self._word[state] = keyword
+            self._out[state].append(keyword)
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # 접미사로 끝나는 키워드도 함께 보고
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """모든 키워드 등장을 (시작, 끝, 키워드) 목록으로 반환 (겹치는 등장 포함)"""
+        hits = []
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in out[state]:
+                hits.append((i + 1 - len(keyword), i + 1, keyword))
+        return hits
+
+    def search(self, text: str) -> bool:
+        """키워드가 하나라도 등장하는지 (첫 등장에서 바로 종료)"""
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return True
+        return False
+
+    def longest_prefix(self, text: str) -> str:
+        """text의 접두사 중 가장 긴 키워드 (예: '서울대병원에서' → '서울대병원')"""
+        best = None
+        state = 0
+        for ch in text:
+            state = self._goto[state].get(ch)
+            if state is None:
+                break
+            if self._word[state] is not None:
+                best = self._word[state]
+        return best
+
+# 문장 경계: 문장부호 뒤 공백 또는 줄바꿈
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """텍스트를 문장 단위 (시작, 끝) 문자 위치로 분할 (경계의 공백은 제외)"""
+    spans = []
+    start = 0
+    for m in SENTENCE_BOUNDARY.finditer(text):
+        if m.start() > start:
+            spans.append((start, m.start()))
+        start = m.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+# ================== 0단계: 후보 사전 검사 ==================
+# tests/common_test_cases.py (MedicalPrivacyDetector) 와 tests/test_existing.py
+# (test_regex_patterns) 의 패턴을 재현율 단계별로 묶은 것. 높은 단계는 낮은 단계를 포함한다.
+KOREAN_SURNAMES = (
+    "김|이|박|최|정|강|조|윤|장|임|한|오|서|신|권|황|안|송|류|유|전|홍|고|문|양|손|배|백|허|남|심|노|하|"
+    "곽|성|차|주|우|구|민|진|지|엄|채|원|천|방|공|현|변|염|여|추|도|소|석|선|설|마|길|연|위|표|명|기|반|"
+    "라|왕|금|옥|육|인|맹|제|모|탁|국|어|은|편|용|예|경|봉|사|부|황보|남궁|제갈|선우|독고"
+)
+PREFILTER_PATTERNS = [
+    # 0: 구조화된 식별자
+    {
+        'phone': r'\d{2,3}-\d{3,4}-\d{4}',
+        'email': r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
+        'api_key': r'sk-[A-Za-z0-9_-]+',
+        'credit_card': r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b',
+        'date_age': r'\d+\s*(?:년|월|일|세|살)',
+    },
+    # 1 (기본): 성씨로 시작하는 이름, 의료기관, 숫자, 질환명 어미
+    # TestCases 26개 기준 NER 생략률은 단계 0/1/2에서 61.5%/3.8%/0% (benchmark.py --mode prefilter).
+    # 단계 1에서 못 건너뛴 LOW/NONE 7개는 모두 'name'(성씨 음절로 시작하는 2~4음절 단어)에 걸리고,
+    # 'digits'는 그중 어느 것에도 걸리지 않는다. digits를 빼도 생략이 늘지 않고 오히려 단독으로
+    # 잡던 CRITICAL 케이스(AWS 키 'AKIA1234567890', 구조화 패턴 형식 아님)를 놓치므로 유지한다.
+    {
+        'name': rf'(?<![가-힣])(?:{KOREAN_SURNAMES})[가-힣]{{1,3}}(?=\s|님|씨|$|[^가-힣])',
+        'facility': r'병원|의원|의료원|클리닉|센터|응급실',
+        'digits': r'\d',
+        'disease': r'암|종양|질환|증후군',
+    },
+    # 2: 과탐지가 많은 넓은 패턴
+    {
+        'korean_name': r'[가-힣]{2,4}(?=\s|님|씨|$)',
+        'location': r'[가-힣]+구|[가-힣]+동|[가-힣]+시',
+        'gender': r'남성|여성|남자|여자',
+        'relative_date': r'어제|오늘|내일|작년|올해|내년',
+        'latin_word': r'[A-Za-z]{2,}',
+    },
+]
+
+class CandidatePrefilter:
+    """NER 전에 개인정보 후보가 있을 수 있는지 정규식으로 빠르게 검사
+
+    recall_margin(0~2)이 클수록 더 넓은 패턴을 포함해 NER을 덜 건너뛴다.
+    1 이상에서는 copula 가제티어(기관/질병/날짜 범주값) 등장도 후보로 본다.
+    """
+
+    def __init__(self, recall_margin: int = 1, gazetteer_source=None):
+        self.recall_margin = recall_margin
+        patterns = {}
+        for tier in PREFILTER_PATTERNS[:recall_margin + 1]:
+            patterns.update(tier)
+        self.pattern = re.compile("|".join(f"(?:{p})" for p in patterns.values()))
+        # KeywordAutomaton을 돌려주는 함수 (빈도표 갱신으로 다시 만들어질 수 있어 매번 조회)
+        self.gazetteer_source = gazetteer_source if recall_margin >= 1 else None
+
+    def has_candidate(self, text: str) -> bool:
+        if self.pattern.search(text):
+            return True
+        return self.gazetteer_source is not None and self.gazetteer_source().search(text)
 
 # ================== 1단계: 학습된 NER 모델 ==================
 class TrainedNERModel:
     """학습된 KoELECTRA NER 모델 로더"""
 
-    def __init__(self, model_path: str, base_model: str = "monologg/koelectra-base-v3-discriminator"):
+    def __init__(self, model_path: str, base_model: str = "monologg/koelectra-base-v3-discriminator",
+                 max_length: int = 128, stride: int = 32, windowed: bool = True,
+                 sentence_cache_size: int = 4096):
         self.model_path = model_path
         self.base_model = base_model
+        self.max_length = max_length
+        # max_length를 넘는 문서는 stride만큼 겹치는 윈도우로 나눠 추론
+        self.stride = stride
+        self.windowed = windowed
+        # 문장별 NER 결과 LRU (단어 열이 같은 문장은 다시 추론하지 않음, 0이면 비활성)
+        self.sentence_cache = ResultCache(sentence_cache_size, ttl=None) if sentence_cache_size else None
         self.tokenizer = None
         self.model = None
         self.id2label = None
@@ -83,51 +286,194 @@ class TrainedNERModel:
         print("⚠️  더미 NER 모델 사용 중 (실제 모델 경로를 설정하세요)")
 
     def predict(self, sentence: str) -> List[NERResult]:
+        return self.predict_batch([sentence])[0]
+
+    def predict_batch(self, sentences: List[str], batch_size: int = 32,
+                      bucket_by_length: bool = True) -> List[List[NERResult]]:
+        """여러 문장을 batch_size 단위로 묶어 한 번의 forward pass로 추론
+
+        bucket_by_length=True이면 길이가 비슷한 문장끼리 묶어 배치 내 패딩을 최소화하고,
+        결과는 입력 순서대로 돌려준다. 문장 캐시가 켜져 있으면 입력을 문장 단위로 나눠
+        처음 보는 문장만 모아서 추론한다.
+        """
+        if self.sentence_cache is None:
+            return self._predict_texts(sentences, batch_size, bucket_by_length)
+
+        split = [[(start, text[start:end]) for start, end in split_sentences(text)] for text in sentences]
+        found, pending = {}, {}
+        for items in split:
+            for _, sentence in items:
+                key = self._sentence_key(sentence)
+                if key in found or key in pending:
+                    # 같은 배치 안에서 반복된 문장도 추론 없이 재사용되므로 적중으로 집계
+                    self.sentence_cache.record_hit()
+                    continue
+                rel = self.sentence_cache.get(key)
+                if rel is None:
+                    pending[key] = sentence
+                else:
+                    found[key] = rel
+
+        keys = list(pending)
+        for key, res in zip(keys, self._predict_texts([pending[k] for k in keys], batch_size, bucket_by_length)):
+            found[key] = self._to_word_relative(pending[key], res)
+            self.sentence_cache.put(key, found[key])
+
+        results = []
+        for items in split:
+            merged = []
+            for offset, sentence in items:
+                merged.extend(self._from_word_relative(sentence, offset, found[self._sentence_key(sentence)]))
+            results.append(merged)
+        return results
+
+    def _sentence_key(self, sentence: str) -> bytes:
+        """공백 차이를 무시한 문장 키 (NER 입력은 공백으로 나눈 단어 열이므로)"""
+        words = "\x00".join(sentence[a:b] for a, b in self._word_spans(sentence))
+        return hashlib.blake2b(words.encode(), digest_size=16).digest()
+
+    def _to_word_relative(self, sentence: str, results: List[NERResult]) -> List[Tuple]:
+        """문자 위치를 (단어 번호, 단어 내 위치)로 바꿔 공백만 다른 문장에도 재사용 가능하게 저장"""
+        starts = [a for a, _ in self._word_spans(sentence)]
+        rel = []
+        for r in results:
+            first = bisect.bisect_right(starts, r.start_pos) - 1
+            last = bisect.bisect_right(starts, r.end_pos - 1) - 1
+            rel.append((r.entity, first, r.start_pos - starts[first], last, r.end_pos - starts[last]))
+        return rel
+
+    def _from_word_relative(self, sentence: str, offset: int, rel: List[Tuple]) -> List[NERResult]:
+        starts = [a for a, _ in self._word_spans(sentence)]
+        results = []
+        for entity, first, start_in_word, last, end_in_word in rel:
+            start, end = starts[first] + start_in_word, starts[last] + end_in_word
+            results.append(NERResult(token=sentence[start:end], entity=entity,
+                                     start_pos=offset + start, end_pos=offset + end))
+        return results
+
+    def _predict_texts(self, sentences: List[str], batch_size: int,
+                       bucket_by_length: bool) -> List[List[NERResult]]:
         if self.model is None:
-            return self._dummy_predict(sentence)
+            return [self._dummy_predict(s) for s in sentences]
 
-        tokens = sentence.split()
+        order = list(range(len(sentences)))
+        if bucket_by_length:
+            order.sort(key=lambda i: len(sentences[i]))
+
+        results = [None] * len(sentences)
+        for i in range(0, len(order), batch_size):
+            chunk = order[i:i + batch_size]
+            for idx, res in zip(chunk, self._predict_chunk([sentences[j] for j in chunk], batch_size)):
+                results[idx] = res
+        return results
+
+    def _predict_chunk(self, sentences: List[str], batch_size: int) -> List[List[NERResult]]:
+        word_spans = [self._word_spans(s) for s in sentences]
+        token_lists = [[s[a:b] for a, b in spans] for s, spans in zip(sentences, word_spans)]
+        # 동적 패딩: max_length 고정 대신 배치 내 가장 긴 샘플 길이까지만 패딩
         enc = self.tokenizer(
-            tokens, is_split_into_words=True,
-            return_tensors="pt", padding="max_length",
-            truncation=True, max_length=128
+            token_lists, is_split_into_words=True,
+            return_tensors="pt", padding=True,
+            truncation=True, max_length=self.max_length,
+            stride=self.stride if self.windowed else 0,
+            return_overflowing_tokens=self.windowed,
+            return_offsets_mapping=True
         )
+        sample_map = enc.pop("overflow_to_sample_mapping", None)
+        # 단어 내부 문자 오프셋 (is_split_into_words이므로 단어 시작 기준)
+        offsets = enc.pop("offset_mapping").tolist()
 
-        with torch.no_grad():
-            logits = self.model(**enc).logits
+        # 문장별 {word_id: (문맥 길이, 예측 라벨 id, 단어 내 시작, 단어 내 끝)}
+        word_preds = [{} for _ in sentences]
+        num_rows = enc["input_ids"].shape[0]
 
-        preds = logits.argmax(-1)[0].tolist()
-        word_ids = enc.word_ids()
+        # 긴 문서의 윈도우들도 batch_size 행씩 나눠 forward → 메모리 사용량 상한 유지
+        for start in range(0, num_rows, batch_size):
+            batch = {k: v[start:start + batch_size] for k, v in enc.items()}
+            with torch.no_grad():
+                preds = self.model(**batch).logits.argmax(-1).tolist()
 
-        results = []
-        last_word_id = None
+            for offset, row_preds in enumerate(preds):
+                row = start + offset
+                sample = int(sample_map[row]) if sample_map is not None else row
+                self._merge_window(word_preds[sample], enc.word_ids(row), row_preds, offsets[row])
+
+        return [
+            self._decode_predictions(sentences[b], word_spans[b], word_preds[b])
+            for b in range(len(sentences))
+        ]
+
+    @staticmethod
+    def _word_spans(sentence: str) -> List[Tuple[int, int]]:
+        """sentence.split()과 같은 단어 단위의 (시작, 끝) 문자 위치"""
+        return [m.span() for m in re.finditer(r"\S+", sentence)]
 
+    @staticmethod
+    def _merge_window(word_preds: Dict, word_ids: List, preds: List[int], offsets: List):
+        """겹치는 윈도우 예측을 word id 기준으로 병합
+
+        같은 단어가 여러 윈도우에 나타나면 윈도우 경계에서 가장 먼 (양쪽 문맥이 가장 긴)
+        위치의 예측을 사용한다.
+        """
+        # word_id -> [첫 서브워드 위치, 마지막 서브워드 위치]
+        word_pos = {}
         for i, word_id in enumerate(word_ids):
-            if word_id is None or word_id == last_word_id:
+            if word_id is None:
                 continue
-
-            # raw 라벨 변환 (PER_B -> B-PER 등)
-            raw_label = self.id2label[preds[i]]
-            if "_" in raw_label:
-                tag, pos = raw_label.split("_")
-                entity_label = f"{pos}-{tag}"
+            if word_id in word_pos:
+                word_pos[word_id][1] = i
             else:
-                entity_label = raw_label
+                word_pos[word_id] = [i, i]
+        if not word_pos:
+            return
+
+        positions = [i for i, w in enumerate(word_ids) if w is not None]
+        first, last = positions[0], positions[-1]
 
+        for word_id, (i, j) in word_pos.items():
+            context = min(i - first, last - i)
+            if word_id not in word_preds or context > word_preds[word_id][0]:
+                word_preds[word_id] = (context, preds[i], offsets[i][0], offsets[j][1])
+
+    def _decode_predictions(self, sentence: str, word_spans: List[Tuple[int, int]],
+                            word_preds: Dict) -> List[NERResult]:
+        results = []
+        for word_id, (_, pred, rel_start, rel_end) in sorted(word_preds.items()):
+            word_start = word_spans[word_id][0]
             results.append(NERResult(
-                token=tokens[word_id],
-                entity=entity_label,
-                start_pos=0,
-                end_pos=len(tokens[word_id])
+                token=sentence[word_start + rel_start:word_start + rel_end],
+                entity=self._convert_label(self.id2label[pred]),
+                start_pos=word_start + rel_start,
+                end_pos=word_start + rel_end
             ))
-            last_word_id = word_id
+        return self._merge_bio(sentence, results)
 
-        return results
+    @staticmethod
+    def _merge_bio(sentence: str, results: List[NERResult]) -> List[NERResult]:
+        """B-X 뒤에 이어지는 I-X 단어들을 원문 위치 기준 하나의 개체로 병합"""
+        merged = []
+        for r in results:
+            prev = merged[-1] if merged else None
+            if (prev is not None and r.entity.startswith("I-") and prev.entity != "O"
+                    and prev.entity[2:] == r.entity[2:]):
+                prev.end_pos = r.end_pos
+                prev.token = sentence[prev.start_pos:prev.end_pos]
+            else:
+                merged.append(r)
+        return merged
+
+    @staticmethod
+    def _convert_label(raw_label: str) -> str:
+        # raw 라벨 변환 (PER_B -> B-PER 등)
+        if "_" in raw_label:
+            tag, pos = raw_label.split("_")
+            return f"{pos}-{tag}"
+        return raw_label
 
     def _dummy_predict(self, sentence: str) -> List[NERResult]:
-        tokens = sentence.split()
         results = []
-        for token in tokens:
+        for start, end in self._word_spans(sentence):
+            token = sentence[start:end]
             entity = 'O'
             if any(name in token for name in ['김','박','이','최','정','한']):
                 entity = 'B-PER'
@@ -135,23 +481,163 @@ class TrainedNERModel:
                 entity = 'B-ORG'
             elif any(date in token for date in ['년','월','일']):
                 entity = 'B-DATE'
-            elif '010-' in token or '02-' in token:
-                entity = 'B-CONTACT'
-            results.append(NERResult(token=token, entity=entity))
+            results.append(NERResult(token=token, entity=entity, start_pos=start, end_pos=end))
+        return results
+
+# ================== 1-1단계: 구조화 식별자 탐지 ==================
+# 분기마다 첫 글자를 먼저 소비한 뒤 lookbehind로 앞 글자를 확인 (한글은 \w라서 \b로는
+# '5678로', 'abc@naver.com입니다' 같은 경계를 못 잡으므로 경계는 모두 ASCII 문자 클래스로 씀).
+# 맨 앞 lookahead는 후보가 될 수 없는 글자(한글 등)를 빠르게 건너뜀
+STRUCTURED_PII_PATTERN = re.compile(
+    r'(?=[0-9A-Za-z._%+-])(?:'
+    r'(?P<RRN>\d(?<!\d\d)\d{5}-?[1-8]\d{6}(?!\d))'
+    r'|(?P<CARD>\d(?<!\d\d)\d{3}(?:[- ]?\d{4}){2}[- ]?\d{1,7}(?!\d))'
+    r'|(?P<CONTACT>[0+](?<![\d+][0+])(?:(?<=\+)82-?)?(?:1[016789]|2|[3-6][1-5]|70)-?\d{3,4}-?\d{4}(?!\d))'
+    r'|(?P<EMAIL>[A-Za-z0-9._%+-](?<![A-Za-z0-9_.%+-][A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})'
+    r'|(?P<API_KEY>[sAga](?<![A-Za-z0-9_][sAga])(?:k-(?:proj-)?[A-Za-z0-9_-]{20,}|KIA[0-9A-Z]{16}|hp_[A-Za-z0-9]{36}|Iza[0-9A-Za-z_-]{35})(?![A-Za-z0-9_])))'
+)
+
+def _rrn_date_valid(digits: str) -> bool:
+    """주민등록번호 앞자리가 생년월일 형식인지 확인"""
+    month, day = int(digits[2:4]), int(digits[4:6])
+    return 1 <= month <= 12 and 1 <= day <= 31
+
+def _rrn_valid(digits: str) -> bool:
+    """주민등록번호 생년월일과 검증번호 확인 (가중치 2~9,2~5)"""
+    if not _rrn_date_valid(digits):
+        return False
+    total = sum(int(d) * w for d, w in zip(digits[:12], (2, 3, 4, 5, 6, 7, 8, 9, 2, 3, 4, 5)))
+    return (11 - total % 11) % 10 == int(digits[12])
+
+def _luhn_valid(digits: str) -> bool:
+    if not 13 <= len(digits) <= 19:
+        return False
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        d = int(d)
+        if i % 2:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+class StructuredPIIDetector:
+    """주민등록번호/카드번호/전화번호/이메일/API 키를 정규식 한 번으로 탐지
+
+    검증번호가 있는 식별자(주민등록번호, 카드번호)는 체크섬이 맞는 경우만 보고한다.
+    주민등록번호 체크섬이 틀린 13자리 숫자는 카드번호(Luhn)로도 확인한다.
+    단 2020년 10월 이후 발급된 주민등록번호는 검증번호가 없으므로, 체크섬이 틀려도
+    생년월일 형식이 맞으면 RRN_UNVERIFIED로 보고한다 (위험도는 RRN보다 낮음).
+    NER 모델과 무관하게 동작하며 결과는 NER 결과와 같은 NERResult 형식이다.
+    """
+
+    validators = {
+        'RRN': _rrn_valid,
+        'CARD': _luhn_valid,
+    }
+    # 체크섬 실패 시 형식만 맞으면 낮은 신뢰도 유형으로 보고
+    unverified = {
+        'RRN': _rrn_date_valid,
+    }
+
+    # 검증에 실패한 후보를 같은 글자열로 다시 검사할 유형과 그 형식
+    # (13자리 숫자는 RRN 분기가 먼저 가져가므로 13자리 카드번호도 여기서 확인)
+    retry_as = {
+        'RRN': ('CARD', re.compile(r'\d{4}(?:[- ]?\d{4}){2}[- ]?\d{1,7}')),
+    }
+
+    def detect(self, text: str) -> List[NERResult]:
+        results = []
+        for m in STRUCTURED_PII_PATTERN.finditer(text):
+            kind = self._verified_kind(m.lastgroup, m.group())
+            if kind:
+                results.append(NERResult(token=m.group(), entity=f'B-{kind}', start_pos=m.start(), end_pos=m.end()))
         return results
 
+    def _verified_kind(self, kind: str, token: str) -> Optional[str]:
+        """검증을 통과한 유형 반환 (체크섬 -> 다른 유형 체크섬 -> 형식만 확인 순, 모두 실패하면 None)"""
+        validator = self.validators.get(kind)
+        if validator is None:
+            return kind
+        digits = re.sub(r'\D', '', token)
+        if validator(digits):
+            return kind
+        retry = self.retry_as.get(kind)
+        if retry and retry[1].fullmatch(token) and self.validators[retry[0]](digits):
+            return retry[0]
+        fallback = self.unverified.get(kind)
+        if fallback and fallback(digits):
+            return f'{kind}_UNVERIFIED'
+        return None
+
+    @staticmethod
+    def merge(ner_results: List[NERResult], detections: List[NERResult]) -> List[NERResult]:
+        """NER 결과에 탐지 결과를 합침 (탐지 구간 안에 완전히 들어가는 NER 개체는 제거)"""
+        if not detections:
+            return ner_results
+        kept = [r for r in ner_results
+                if not any(d.start_pos <= r.start_pos and r.end_pos <= d.end_pos for d in detections)]
+        return sorted(kept + detections, key=lambda r: r.start_pos)
+
 # ================== 2단계: Copula 위험도 분석 ==================
+# 저장 포맷이 바뀌면 버전을 올려 이전 아티팩트를 무시하고 다시 fit
+COPULA_ARTIFACT_VERSION = 4
+DEFAULT_COPULA_ARTIFACT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts", "copula")
+
+def load_frequency_table(path: str, attribute: str = None) -> Dict[str, pd.Series]:
+    """CSV/Parquet 빈도표를 {속성: 값별 빈도 Series}로 로드
+
+    (attribute, value, count) 형식이면 속성별로 나누고,
+    (value, count) 형식이면 attribute 인자로 속성 이름을 지정한다.
+    Parquet 파일을 읽으려면 pyarrow가 필요하다.
+    """
+    if path.endswith(('.parquet', '.pq')):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, dtype={'value': str})
+    df['value'] = df['value'].astype(str)
+    if 'attribute' not in df.columns:
+        if attribute is None:
+            raise ValueError(f"{path}: attribute 컬럼이 없으면 attribute 인자가 필요합니다")
+        df['attribute'] = attribute
+    return {
+        attr: group.groupby('value', sort=False)['count'].sum()
+        for attr, group in df.groupby('attribute', sort=False)
+    }
+
 class CopulaRiskAnalyzer:
-    def __init__(self):
-        self._setup_copula_model()
-        self.token_to_feature = {
-            '서울대병원': {'기관_서울대병원':1,'기관_삼성서울':0,'기관_연세의료원':0},
-            '삼성서울병원': {'기관_서울대병원':0,'기관_삼성서울':1,'기관_연세의료원':0},
-            '간암': {'질병_간암':1,'질병_백혈병':0,'질병_고혈압':0},
-            '백혈병': {'질병_간암':0,'질병_백혈병':1,'질병_고혈압':0},
-            '2023년': {'날짜_2023년':1,'날짜_2022년':0,'날짜_2021년':0},
-            '2024년': {'날짜_2023년':0,'날짜_2022년':1,'날짜_2021년':0},
+    """범주형 주변분포 + Gaussian copula 기반 준식별자 위험도 분석기
+
+    속성(기관/질병/날짜 등)마다 범주값을 정수 코드로 관리하고, copula에서 뽑은
+    균등분포 샘플(_uniforms)을 각 속성의 누적 빈도로 코드화한다. 빈도표가 바뀌면
+    해당 속성의 코드 열만 다시 계산하므로 전체 모델을 다시 fit하지 않는다.
+
+    준식별자는 (속성 번호, 범주 코드) 정수 쌍으로 표현하며, 원-핫 컬럼 없이 코드
+    행렬과 범주별 CSR 포스팅 리스트만 보관하므로 범주 수가 늘어도 메모리는
+    샘플 수에 비례한다.
+    """
+
+    # 직접 식별자 위험도 (없는 유형은 100). 검증번호가 맞지 않는 주민등록번호는
+    # 오탐일 수 있으므로 낮추되 기본 임계값(50)에서는 마스킹됨
+    direct_risk = {'B-RRN_UNVERIFIED': 80}
+
+    def __init__(self, artifact_path: str = None, max_combination_size: int = 4,
+                 frequency_tables: Dict[str, pd.Series] = None, num_samples: int = 1000):
+        # 조합 인덱스에 넣을 최대 준식별자 속성 수 (인덱스 크기 상한)
+        self.max_combination_size = max_combination_size
+        self.num_samples = num_samples
+        # 토큰 → (속성, 범주값) 별칭. 범주값과 같은 토큰은 별칭 없이도 인식된다
+        self.token_aliases = {
+            '서울대병원': ('기관', '서울대병원'),
+            '삼성서울병원': ('기관', '삼성서울'),
+            '간암': ('질병', '간암'),
+            '백혈병': ('질병', '백혈병'),
+            '2023년': ('날짜', '2023년'),
+            '2024년': ('날짜', '2022년'),
         }
+        if not (artifact_path and self._load_artifact(artifact_path)):
+            self._setup_copula_model()
+        for attr, table in (frequency_tables or {}).items():
+            self.update_frequency_table(attr, table, replace=True)
 
     def _setup_copula_model(self):
         np.random.seed(42)
@@ -160,77 +646,438 @@ class CopulaRiskAnalyzer:
             '질병': np.random.choice(['간암','백혈병','고혈압'],1000),
             '날짜': np.random.choice(['2023년','2022년','2021년'],1000)
         })
-        df_encoded = pd.get_dummies(df_sample).astype(float)
+        self.fit_records(df_sample)
+
+    def fit_records(self, df: pd.DataFrame):
+        """레코드 단위 데이터로 전체 모델 fit (속성 간 상관관계 + 주변분포)
+
+        원-핫 대신 범주형 코드로 인코딩해 범주 수가 늘어도 컬럼 수는 속성 수로 고정된다.
+        """
+        df_codes = pd.DataFrame(index=df.index)
+        self.attributes = list(df.columns)
+        self.categories, self.marginals = {}, {}
+        for attr in self.attributes:
+            cat = df[attr].astype(str).astype('category')
+            self.categories[attr] = list(cat.cat.categories)
+            self.marginals[attr] = np.bincount(cat.cat.codes, minlength=len(self.categories[attr])).astype(np.float64)
+            df_codes[attr] = cat.cat.codes.astype(float)
+
         self.copula_model = GaussianMultivariate()
-        self.copula_model.fit(df_encoded)
-        # 샘플 수를 1000으로 줄여 속도 개선
-        self.samples = self.copula_model.sample(1000).round()
+        self.copula_model.fit(df_codes)
+        self.correlation = self.copula_model.correlation.loc[self.attributes, self.attributes].to_numpy()
+
+        rng = np.random.default_rng(42)
+        latent = rng.multivariate_normal(np.zeros(len(self.attributes)), self.correlation, size=self.num_samples)
+        self._uniforms = ndtr(latent).astype(np.float32)
+        self._sample_codes = np.column_stack([
+            self._codes_from_uniforms(attr, self._uniforms[:, a]) for a, attr in enumerate(self.attributes)
+        ]).astype(np.int32)
+        self._refresh_lookups()
+        self._build_postings()
+        self._build_combination_index()
+
+    def _codes_from_uniforms(self, attr: str, uniforms: np.ndarray) -> np.ndarray:
+        """속성의 누적 빈도(역CDF)로 균등분포 샘플을 범주 코드로 변환"""
+        counts = self.marginals[attr]
+        cdf = np.cumsum(counts) / counts.sum()
+        return np.minimum(np.searchsorted(cdf, uniforms, side='right'), len(counts) - 1)
+
+    def _refresh_lookups(self):
+        self._attr_order = {attr: i for i, attr in enumerate(self.attributes)}
+        self._category_codes = {attr: {v: i for i, v in enumerate(values)} for attr, values in self.categories.items()}
+        # 범주값 → (속성 번호, 코드). 여러 속성에 같은 값이 있으면 앞선 속성 우선
+        self._value_to_qid = {}
+        # 부분 일치용 가제티어 오토마톤은 처음 필요할 때 생성
+        self._gazetteer = None
+        for a, attr in enumerate(self.attributes):
+            for code, value in enumerate(self.categories[attr]):
+                self._value_to_qid.setdefault(value, (a, code))
+
+    def _build_postings(self, attribute: str = None):
+        """속성별 (범주 × 샘플) CSR 행렬. 행 하나가 그 범주를 가진 샘플 번호 목록"""
+        if attribute is None:
+            self._postings = {}
+        for a, attr in enumerate(self.attributes):
+            if attribute is not None and attr != attribute:
+                continue
+            codes = np.asarray(self._sample_codes[:, a])
+            self._postings[a] = csr_matrix(
+                (np.ones(len(codes), dtype=np.bool_), (codes, np.arange(len(codes)))),
+                shape=(len(self.categories[attr]), len(codes))
+            )
+
+    def update_frequency_table(self, attribute: str, table: pd.Series, replace: bool = False):
+        """한 속성의 빈도표를 증분 반영하고 그 속성의 주변분포만 다시 fit
+
+        기존 범주 코드는 유지하고 새 범주는 뒤에 추가한다. replace=False이면 빈도를
+        누적하고, True이면 표에 있는 범주의 빈도를 덮어쓴다.
+        """
+        if attribute not in self._attr_order:
+            # 새 속성: 상관관계를 모르므로 독립인 균등분포 열을 추가
+            self.attributes.append(attribute)
+            self.categories[attribute] = []
+            self.marginals[attribute] = np.zeros(0)
+            size = len(self.attributes)
+            correlation = np.eye(size)
+            correlation[:size - 1, :size - 1] = self.correlation
+            self.correlation = correlation
+            rng = np.random.default_rng(len(self.attributes))
+            self._uniforms = np.column_stack([self._uniforms, rng.random(len(self._uniforms), dtype=np.float32)])
+            self._sample_codes = np.column_stack([self._sample_codes, np.zeros(len(self._sample_codes), dtype=np.int32)])
+            self._refresh_lookups()
+
+        codes = self._category_codes[attribute]
+        values = self.categories[attribute]
+        for value in map(str, table.index):
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+                self._value_to_qid.setdefault(value, (self._attr_order[attribute], codes[value]))
+                self._gazetteer = None
+
+        counts = np.concatenate([self.marginals[attribute], np.zeros(len(values) - len(self.marginals[attribute]))])
+        idx = np.fromiter((codes[str(v)] for v in table.index), dtype=np.int64, count=len(table))
+        if replace:
+            counts[idx] = table.to_numpy(dtype=np.float64)
+        else:
+            np.add.at(counts, idx, table.to_numpy(dtype=np.float64))
+        self.marginals[attribute] = counts
+
+        a = self._attr_order[attribute]
+        self._sample_codes = np.array(self._sample_codes)
+        self._sample_codes[:, a] = self._codes_from_uniforms(attribute, self._uniforms[:, a])
+        self._build_postings(attribute)
+        self._build_combination_index(changed=attribute)
+
+    def _build_combination_index(self, changed: str = None):
+        """샘플의 준식별자 조합 → 빈도 해시 인덱스 생성
+
+        max_combination_size 이하의 모든 속성 조합에 대해 ((속성 번호, 코드), ...)
+        튜플별 빈도를 센다. 질의 시에는 범주 수와 무관하게 dict 조회 한 번으로
+        결합 확률을 얻는다. changed가 주어지면 그 속성이 포함된 조합만 다시 센다.
+        """
+        if changed is None:
+            self.combination_index = {}
+        else:
+            changed_idx = self._attr_order[changed]
+            self.combination_index = {
+                key: count for key, count in self.combination_index.items()
+                if all(a != changed_idx for a, _ in key)
+            }
+
+        codes = self._sample_codes
+        num_attrs = len(self.attributes)
+        for size in range(1, min(self.max_combination_size, num_attrs) + 1):
+            for subset in itertools.combinations(range(num_attrs), size):
+                if changed is not None and self._attr_order[changed] not in subset:
+                    continue
+                rows, counts = np.unique(codes[:, subset], axis=0, return_counts=True)
+                for row, count in zip(rows.tolist(), counts.tolist()):
+                    self.combination_index[tuple(zip(subset, row))] = count
+
+    def save_artifact(self, path: str):
+        """fit된 copula 파라미터와 조합 인덱스를 디렉토리에 저장 (오프라인 빌드 단계)"""
+        os.makedirs(path, exist_ok=True)
+        # 로드된 배열이 같은 파일의 메모리 매핑일 수 있으므로 (--base와 --output이 같을 때)
+        # 임시 파일에 쓴 뒤 교체. 기존 매핑은 교체 후에도 이전 파일을 계속 가리킨다.
+        self._save_replacing(path, "uniforms.npy", lambda f: np.save(f, self._uniforms))
+        self._save_replacing(path, "sample_codes.npy", lambda f: np.save(f, np.asarray(self._sample_codes)))
+        meta = {
+            'version': COPULA_ARTIFACT_VERSION,
+            'attributes': self.attributes,
+            'categories': self.categories,
+            'marginals': {attr: counts.tolist() for attr, counts in self.marginals.items()},
+            'correlation': self.correlation.tolist(),
+            'copula_model': self.copula_model.to_dict(),
+            'combination_index': [[list(map(list, key)), count] for key, count in self.combination_index.items()],
+        }
+        # 메타데이터를 마지막에 교체해 중간에 실패하면 로드 시 검증에서 걸러지게 함
+        self._save_replacing(path, "copula.json", lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode()))
+
+    @staticmethod
+    def _save_replacing(path: str, name: str, write):
+        tmp_path = os.path.join(path, f".{name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(path, name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load_artifact(self, path: str) -> bool:
+        """저장된 아티팩트 로드. 없거나 버전이 다르거나 손상되었으면 False를 반환해 다시 fit하도록 함"""
+        meta_path = os.path.join(path, "copula.json")
+        if not os.path.exists(meta_path):
+            return False
+        try:
+            return self._read_artifact(path, meta_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️  Copula 아티팩트 로드 실패 ({path}: {e}), 다시 fit합니다")
+            return False
+
+    def _read_artifact(self, path: str, meta_path: str) -> bool:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != COPULA_ARTIFACT_VERSION:
+            print(f"⚠️  Copula 아티팩트 버전 불일치 ({meta.get('version')} != {COPULA_ARTIFACT_VERSION}), 다시 fit합니다")
+            return False
+
+        self.copula_model = GaussianMultivariate.from_dict(meta['copula_model'])
+        self.attributes = meta['attributes']
+        self.categories = meta['categories']
+        self.marginals = {attr: np.array(counts) for attr, counts in meta['marginals'].items()}
+        self.correlation = np.array(meta['correlation'])
+        # 샘플 행렬은 메모리 매핑으로 로드해 워커 간 페이지 캐시를 공유
+        self._uniforms = np.load(os.path.join(path, "uniforms.npy"), mmap_mode='r')
+        self._sample_codes = np.load(os.path.join(path, "sample_codes.npy"), mmap_mode='r')
+        if self._uniforms.shape != self._sample_codes.shape or self._uniforms.shape[1:] != (len(self.attributes),):
+            raise ValueError(f"샘플 행렬 크기 불일치 {self._uniforms.shape} / {self._sample_codes.shape}")
+        self.num_samples = len(self._sample_codes)
+        self.combination_index = {tuple(map(tuple, key)): count for key, count in meta['combination_index']}
+        self._refresh_lookups()
+        self._build_postings()
+        return True
+
+    def lookup_qid(self, token: str) -> Tuple[int, int]:
+        """토큰의 준식별자 (속성 번호, 범주 코드)
+
+        별칭 사전 → 범주값 순으로 정확히 일치하는 항목을 찾고, 없으면 가제티어
+        오토마톤으로 토큰 앞부분에 붙은 가장 긴 항목을 찾는다 ('서울대병원에서').
+        """
+        qid = self._exact_qid(token)
+        if qid is None:
+            prefix = self.gazetteer.longest_prefix(token)
+            if prefix is not None:
+                qid = self._exact_qid(prefix)
+        return qid
+
+    @property
+    def gazetteer(self) -> KeywordAutomaton:
+        """별칭과 범주값 전체로 만든 가제티어 오토마톤 (처음 필요할 때 생성)"""
+        if self._gazetteer is None:
+            self._gazetteer = KeywordAutomaton(itertools.chain(self.token_aliases, self._value_to_qid))
+        return self._gazetteer
+
+    def _exact_qid(self, token: str) -> Tuple[int, int]:
+        alias = self.token_aliases.get(token)
+        if alias is not None:
+            code = self._category_codes.get(alias[0], {}).get(alias[1])
+            if code is not None:
+                return self._attr_order[alias[0]], code
+        return self._value_to_qid.get(token)
+
+    def describe_qid(self, qid: Tuple[int, int]) -> str:
+        attr = self.attributes[qid[0]]
+        return f"{attr}_{self.categories[attr][qid[1]]}"
 
     def calculate_risk_weights(self, ner_results: List[NERResult]) -> List[RiskWeight]:
+        categories = [self._categorize_entity(ner.entity) for ner in ner_results]
+        present = self._collect_quasi_identifiers(ner_results, categories)
         risk_weights = []
-        for ner in ner_results:
-            category = self._categorize_entity(ner.entity)
+        for ner, category in zip(ner_results, categories):
             rw = self._calculate_single_risk(ner.token, ner.entity, category)
-            feature = None
-            if ner.token in self.token_to_feature:
-                feature = ", ".join(self.token_to_feature[ner.token].keys())
+            qid = self.lookup_qid(ner.token)
+            if category=='간접' and qid and len(present)>1:
+                # 텍스트 안의 다른 준식별자와 함께 나타날 때의 결합 위험도 반영
+                rw = max(rw, round(self._calculate_joint_risk(qid, present)*100))
+            feature = self.describe_qid(qid) if qid else None
             risk_weights.append(RiskWeight(
                 token=ner.token, entity=ner.entity,
                 category=category, risk_weight=rw,
-                copula_feature=feature
+                copula_feature=feature,
+                start_pos=ner.start_pos, end_pos=ner.end_pos
             ))
         return risk_weights
 
+    def _collect_quasi_identifiers(self, ner_results: List[NERResult], categories: List[str]) -> Dict[int, Tuple]:
+        """텍스트의 간접 식별자를 속성별로 모음 (같은 속성이 여럿이면 가장 희귀한 값)"""
+        present = {}
+        for ner, category in zip(ner_results, categories):
+            qid = self.lookup_qid(ner.token)
+            if category!='간접' or qid is None:
+                continue
+            prev = present.get(qid[0])
+            if prev is None or self.combination_index.get((qid,), 0) < self.combination_index.get((prev,), 0):
+                present[qid[0]] = qid
+        return present
+
+    def _calculate_joint_risk(self, qid: Tuple, present: Dict[int, Tuple]) -> float:
+        """qid와 다른 속성의 준식별자들이 동시에 일치할 확률로 계산한 위험도"""
+        key = tuple(sorted([qid] + [q for a, q in present.items() if a != qid[0]]))
+        if len(key) <= self.max_combination_size:
+            count = self.combination_index.get(key, 0)
+        else:
+            # 인덱스에 없는 큰 조합은 CSR 포스팅 리스트 교집합으로 계산
+            rows = None
+            for a, code in key:
+                posting = self._postings[a].indices[self._postings[a].indptr[code]:self._postings[a].indptr[code + 1]]
+                rows = posting if rows is None else np.intersect1d(rows, posting, assume_unique=True)
+            count = len(rows)
+        return 1 - count/self.num_samples
+
     def _categorize_entity(self, entity: str) -> str:
-        direct = ['B-PER','I-PER','B-CONTACT','I-CONTACT']
+        direct = ['B-PER','I-PER','B-CONTACT','I-CONTACT','B-RRN','B-RRN_UNVERIFIED','B-CARD','B-EMAIL','B-API_KEY']
         indirect = ['B-ORG','I-ORG','B-LOC','I-LOC','B-DATE','I-DATE','B-DISEASE','I-DISEASE']
         if entity in direct: return '직접'
         if entity in indirect: return '간접'
         return '기타'
 
     def _calculate_single_risk(self, token: str, entity: str, category: str) -> int:
-        if category=='직접': return 100
+        if category=='직접': return self.direct_risk.get(entity, 100)
         if category=='간접':
-            feat = self.token_to_feature.get(token)
-            if feat:
-                return round(self._calculate_copula_risk(feat)*100)
+            qid = self.lookup_qid(token)
+            if qid:
+                return round(self._calculate_copula_risk(qid)*100)
             return 30
         return 0
 
-    def _calculate_copula_risk(self, feat: Dict) -> float:
-        match = (self.samples[list(feat.keys())]==pd.Series(feat)).all(axis=1)
-        prob = match.sum()/len(self.samples)
-        return 1-prob
+    def _calculate_copula_risk(self, qid: Tuple) -> float:
+        # 단일 속성 주변확률도 조합 인덱스의 크기 1 항목으로 미리 계산되어 있음
+        return 1 - self.combination_index.get((qid,), 0)/self.num_samples
 
 # ================== 3단계: 문맥적 위험 분석 ==================
+# 개체 유형 수가 이 값 이하이면 모든 유형 부분집합의 배수를 미리 계산 (2^N 테이블)
+MAX_LATTICE_TYPES = 16
+
+def load_combination_rules(path: str) -> Dict[Tuple[str, ...], float]:
+    """고위험 조합 규칙 파일 로드
+
+    JSON: [{"types": ["PER", "ORG", "DATE"], "multiplier": 1.5}, ...]
+    CSV:  types,multiplier 컬럼 (types는 'PER+ORG+DATE' 형식)
+    """
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            rules = [(r['types'], r['multiplier']) for r in json.load(f)]
+    else:
+        df = pd.read_csv(path)
+        rules = [(t.split('+'), m) for t, m in zip(df['types'], df['multiplier'])]
+    return {tuple(t.strip() for t in types): float(mult) for types, mult in rules}
+
 class ContextualRiskAnalyzer:
-    def __init__(self):
+    def __init__(self, combination_rules_path: str = None, window_sentences: int = 2):
+        # 개체 앞뒤로 몇 문장까지를 문맥으로 볼지 (None이면 텍스트 전체)
+        self.window_sentences = window_sentences
         self.high_risk_combinations = {('PER','ORG','DATE'):1.5,('PER','DISEASE','ORG'):1.8,('PER','CONTACT'):2.0,('ORG','DATE','DISEASE'):1.3}
+        if combination_rules_path:
+            self.high_risk_combinations.update(load_combination_rules(combination_rules_path))
+        self._compile_combination_rules()
         self.medical_risk_keywords = {'진단':1.2,'수술':1.2,'입원':1.2,'치료':1.2,'암':1.3,'종양':1.3,'질환':1.3,'응급':1.5,'중환자':1.5}
+        self.keyword_automaton = KeywordAutomaton(self.medical_risk_keywords)
+
+    def analyze_contextual_risk(self, text: str, risk_weights: List[RiskWeight],
+                                use_keywords: bool = True) -> List[RiskWeight]:
+        # use_keywords=False이면 의료 키워드 배수 없이 개체 조합 배수만 적용
+        # 위치 정보가 없으면 문장 창을 정할 수 없으므로 텍스트 전체를 하나의 문맥으로 취급
+        if self.window_sentences is None or not any(rw.end_pos for rw in risk_weights):
+            types = [rw.entity[2:] for rw in risk_weights if rw.entity!='O']
+            kw_mult = self._get_keyword_multiplier(text) if use_keywords else 1.0
+            multipliers = [self._get_combination_multiplier(types) * kw_mult] * len(risk_weights)
+        else:
+            multipliers = self._windowed_multipliers(text, risk_weights, use_keywords)
 
-    def analyze_contextual_risk(self, text: str, risk_weights: List[RiskWeight]) -> List[RiskWeight]:
-        types = [rw.entity[2:] for rw in risk_weights if rw.entity!='O']
-        comb_mult = self._get_combination_multiplier(types)
-        kw_mult = self._get_keyword_multiplier(text)
         adjusted = []
-        for rw in risk_weights:
+        for rw, mult in zip(risk_weights, multipliers):
             w = rw.risk_weight
             if w>0:
-                w = min(100, int(w*comb_mult*kw_mult))
-            adjusted.append(RiskWeight(rw.token,rw.entity,rw.category,w,rw.copula_feature))
+                w = min(100, int(w*mult))
+            adjusted.append(replace(rw, risk_weight=w))
         return adjusted
 
+    def _windowed_multipliers(self, text: str, risk_weights: List[RiskWeight],
+                              use_keywords: bool = True) -> List[float]:
+        """개체마다 앞뒤 window_sentences 문장 안의 개체 조합/키워드만으로 배수 계산
+
+        문장별 개체 유형과 키워드를 한 번 버킷팅한 뒤, 창을 한 문장씩 밀면서 들어오는
+        문장은 더하고 나가는 문장은 빼는 방식이라 문서 길이에 선형이다.
+        """
+        sentences = split_sentences(text) or [(0, len(text))]
+        starts = [start for start, _ in sentences]
+
+        def sentence_of(pos: int) -> int:
+            return max(bisect.bisect_right(starts, pos) - 1, 0)
+
+        sent_types = [[] for _ in sentences]
+        for rw in risk_weights:
+            if rw.entity!='O' and rw.entity[2:] in self._type_bits:
+                sent_types[sentence_of(rw.start_pos)].append(self._type_bits[rw.entity[2:]])
+        sent_keywords = [[] for _ in sentences]
+        for start, _, kw in (self.find_keywords(text) if use_keywords else []):
+            sent_keywords[sentence_of(start)].append(self.medical_risk_keywords[kw])
+
+        type_counts, kw_counts = {}, {}
+        def update(i: int, delta: int):
+            for bit in sent_types[i]:
+                type_counts[bit] = type_counts.get(bit, 0) + delta
+            for mult in sent_keywords[i]:
+                kw_counts[mult] = kw_counts.get(mult, 0) + delta
+
+        w = self.window_sentences
+        for i in range(min(w, len(sentences) - 1) + 1):
+            update(i, 1)
+        sent_mult = []
+        for i in range(len(sentences)):
+            if i > 0:
+                if i + w < len(sentences):
+                    update(i + w, 1)
+                if i - w - 1 >= 0:
+                    update(i - w - 1, -1)
+            mask = 0
+            for bit, count in type_counts.items():
+                if count > 0:
+                    mask |= bit
+            kw_mult = max([m for m, count in kw_counts.items() if count > 0], default=1.0)
+            sent_mult.append(self._multiplier_for_mask(mask) * kw_mult)
+
+        return [sent_mult[sentence_of(rw.start_pos)] for rw in risk_weights]
+
+    def _compile_combination_rules(self):
+        """조합 규칙을 개체 유형 비트마스크로 컴파일
+
+        유형 수가 MAX_LATTICE_TYPES 이하이면 부분집합 격자(2^N 테이블)에 "이 유형
+        집합이 포함하는 규칙들의 최대 배수"를 미리 채워 조회 한 번으로 끝낸다.
+        """
+        types = sorted({t for pat in self.high_risk_combinations for t in pat})
+        self._type_bits = {t: 1 << i for i, t in enumerate(types)}
+        self._rule_masks = [
+            (sum(self._type_bits[t] for t in set(pat)), mult)
+            for pat, mult in self.high_risk_combinations.items()
+        ]
+        self._lattice = None
+        if len(types) <= MAX_LATTICE_TYPES:
+            lattice = np.ones(1 << len(types))
+            for mask, mult in self._rule_masks:
+                lattice[mask] = max(lattice[mask], mult)
+            masks = np.arange(1 << len(types))
+            for bit in self._type_bits.values():
+                # 부분집합(SOS) DP: 비트 하나를 뺀 마스크의 값을 전파
+                with_bit = masks[(masks & bit) != 0]
+                lattice[with_bit] = np.maximum(lattice[with_bit], lattice[with_bit ^ bit])
+            self._lattice = lattice.tolist()
+
     def _get_combination_multiplier(self, types: List[str]) -> float:
+        mask = 0
+        for t in types:
+            mask |= self._type_bits.get(t, 0)
+        return self._multiplier_for_mask(mask)
+
+    def _multiplier_for_mask(self, mask: int) -> float:
+        if self._lattice is not None:
+            return self._lattice[mask]
         m=1.0
-        for pat, mult in self.high_risk_combinations.items():
-            if set(pat).issubset(set(types)):
+        for rule_mask, mult in self._rule_masks:
+            if rule_mask & mask == rule_mask:
                 m = max(m, mult)
         return m
 
+    def find_keywords(self, text: str) -> List[Tuple[int, int, str]]:
+        """의료 위험 키워드 등장 위치를 한 번의 선형 탐색으로 모두 찾음"""
+        return self.keyword_automaton.find_all(text)
+
     def _get_keyword_multiplier(self, text: str) -> float:
         m=1.0
-        for kw, mult in self.medical_risk_keywords.items():
-            if kw in text: m = max(m, mult)
+        for _, _, kw in self.find_keywords(text):
+            m = max(m, self.medical_risk_keywords[kw])
         return m
 
 # ================== 4단계: 마스킹 실행 ==================
@@ -238,46 +1085,434 @@ class MaskingExecutor:
     def __init__(self, threshold: int = 50):
         self.threshold = threshold
         self.mask_patterns = {'PER':'[PERSON]','ORG':'[HOSPITAL]','LOC':'[LOCATION]','DATE':'[DATE]',
-                              'DISEASE':'[DISEASE]','CONTACT':'[CONTACT]','CVL':'[TITLE]','NUM':'[NUMBER]','default':'[MASKED]'}
+                              'DISEASE':'[DISEASE]','CONTACT':'[CONTACT]','CVL':'[TITLE]','NUM':'[NUMBER]',
+                              'RRN':'[RRN]','RRN_UNVERIFIED':'[RRN]','CARD':'[CARD]','EMAIL':'[EMAIL]','API_KEY':'[API_KEY]','default':'[MASKED]'}
 
-    def execute_masking(self, text: str, risk_weights: List[RiskWeight]) -> MaskingResult:
-        masked_text = text
-        log = []
-        masked_count = 0
+    def execute_masking(self, text: str, risk_weights: List[RiskWeight], threshold: int = None) -> MaskingResult:
+        # threshold를 주면 이번 호출에만 적용 (self.threshold는 기본값)
+        threshold = self.threshold if threshold is None else threshold
         total = len([rw for rw in risk_weights if rw.entity!='O'])
-        for rw in sorted(risk_weights, key=lambda x: x.risk_weight, reverse=True):
-            if rw.risk_weight>=self.threshold and rw.entity!='O':
-                et = rw.entity[2:]
-                pat = self.mask_patterns.get(et, self.mask_patterns['default'])
-                if rw.token in masked_text:
-                    masked_text = masked_text.replace(rw.token, pat, 1)
-                    masked_count+=1
-                    log.append({'token':rw.token,'entity':rw.entity,'risk_weight':rw.risk_weight,'masked_as':pat,'reason':f'위험도 {rw.risk_weight} >= 임계값 {self.threshold}'})
-        return MaskingResult(text, masked_text, log, total, masked_count)
+        candidates = [rw for rw in risk_weights if rw.risk_weight>=threshold and rw.entity!='O']
+        spans = self._resolve_overlaps(self._locate_spans(text, candidates))
+        masked_text, position_map, log = self._apply_spans(text, spans, threshold)
+        return MaskingResult(text, masked_text, log, total, len(spans), position_map)
+
+    def _locate_spans(self, text: str, risk_weights: List[RiskWeight]) -> List[Tuple[int, int, RiskWeight]]:
+        spans = []
+        for rw in risk_weights:
+            start, end = rw.start_pos, rw.end_pos
+            if end <= start:
+                # 위치 정보가 없는 외부 입력은 첫 번째 등장 위치로 대체
+                start = text.find(rw.token)
+                if start < 0 or not rw.token:
+                    continue
+                end = start + len(rw.token)
+            spans.append((start, end, rw))
+        return spans
+
+    @staticmethod
+    def _resolve_overlaps(spans: List[Tuple[int, int, RiskWeight]]) -> List[Tuple[int, int, RiskWeight]]:
+        """겹치는 구간을 합집합으로 묶고, 묶음 안에서 (위험도, 길이)가 큰 구간의 유형으로 표시
+
+        후보는 모두 임계값 이상이므로 어느 후보가 덮는 글자든 마스킹 상태로 남아야 한다.
+        (위험도, 길이)가 같으면 앞선 구간의 유형을 쓴다.
+        """
+        spans = sorted(spans, key=lambda s: (s[0], -s[2].risk_weight, -(s[1] - s[0])))
+        kept = []
+        for start, end, rw in spans:
+            if kept and start < kept[-1][1]:
+                last_start, last_end, last_rw, size = kept[-1]
+                if (rw.risk_weight, end - start) > (last_rw.risk_weight, size):
+                    last_rw, size = rw, end - start
+                kept[-1] = (last_start, max(last_end, end), last_rw, size)
+                continue
+            kept.append((start, end, rw, end - start))
+        return [(start, end, rw) for start, end, rw, _ in kept]
+
+    def _apply_spans(self, text: str, spans: List[Tuple[int, int, RiskWeight]], threshold: int):
+        """정렬된 비중첩 구간으로 마스킹 텍스트를 한 번에 생성"""
+        parts, position_map, log = [], [], []
+        cursor = out_pos = 0
+        for start, end, rw in spans:
+            if cursor < start:
+                parts.append(text[cursor:start])
+                position_map.append((out_pos, out_pos + start - cursor, cursor, start))
+                out_pos += start - cursor
+            pat = self.mask_patterns.get(rw.entity[2:], self.mask_patterns['default'])
+            parts.append(pat)
+            position_map.append((out_pos, out_pos + len(pat), start, end))
+            out_pos += len(pat)
+            cursor = end
+            log.append({'token':text[start:end],'entity':rw.entity,'risk_weight':rw.risk_weight,'masked_as':pat,
+                        'start':start,'end':end,'reason':f'위험도 {rw.risk_weight} >= 임계값 {threshold}'})
+        if cursor < len(text):
+            parts.append(text[cursor:])
+            position_map.append((out_pos, out_pos + len(text) - cursor, cursor, len(text)))
+        return "".join(parts), position_map, log
+
+# ================== 결과 캐시 ==================
+class ResultCache:
+    """동일 입력에 대한 결과 재사용 (LRU + TTL, 스레드 안전)
+
+    파이프라인 결과는 (텍스트 해시, 처리 설정, 모델 버전)을 키로 저장하고,
+    TrainedNERModel은 문장별 NER 결과 캐시로도 사용한다.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl  # None이면 만료 없이 크기로만 제거
+        self._entries = OrderedDict()  # key -> (만료 시각, MaskingResult)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @staticmethod
+    def make_key(text: str, settings: Tuple, model_version: str) -> Tuple:
+        return (hashlib.sha256(text.encode()).hexdigest(), settings, model_version)
+
+    def get(self, key: Tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, result):
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+# ================== 증분 처리용 문서 세션 ==================
+@dataclass
+class DocumentSession:
+    """편집 중인 문서의 현재 텍스트와 문장별 NER 결과 (오프셋은 문장 시작 기준)"""
+    text: str = ""
+    version: int = 0
+    sentence_ner: Dict[str, List[NERResult]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+class StaleDocumentError(Exception):
+    """문서 세션이 없거나 클라이언트가 보낸 base_version이 현재 버전과 다름 (전체 텍스트 재전송 필요)"""
+
+class InvalidEditError(ValueError):
+    """delta 형식이 잘못되었거나 편집 범위가 문서 밖임 (클라이언트 요청 오류)"""
+
+# ================== 단계별 성능 측정 ==================
+@contextmanager
+def stage_timer(timings: Dict[str, float], stage: str):
+    """with 블록 소요 시간(ms)을 timings[stage]에 누적"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+class PipelineMetrics:
+    """요청별 단계 소요 시간 분포(p50/p95/p99)와 누적 카운터 (스레드 안전)
+
+    단계마다 최근 reservoir_size개 요청의 측정값만 보관한다.
+    """
+
+    def __init__(self, reservoir_size: int = 2048):
+        self.reservoir_size = reservoir_size
+        self._samples = defaultdict(lambda: deque(maxlen=self.reservoir_size))
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, float], counts: Dict[str, int]):
+        with self._lock:
+            for stage, ms in timings.items():
+                self._samples[stage].append(ms)
+            for name, n in counts.items():
+                self._counters[name] += n
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items()}
+            counters = dict(self._counters)
+        stages = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stages[stage] = {'count': len(values), 'mean_ms': float(values.mean()),
+                             'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+        return {'stages': stages, 'counters': counters}
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
 
 # ================== 전체 파이프라인 통합 ==================
+MASKING_MODES = ('medical', 'general', 'strict')
+STRICT_MODE_THRESHOLD = 30
+# 모드별 동작 (API /api/settings로도 공개)
+MASKING_MODE_DESCRIPTIONS = {
+    'medical': '기본 동작 (의료 키워드 위험도 배수 적용)',
+    'general': '의료 키워드 위험도 배수를 적용하지 않음 (개체 조합 배수만 적용)',
+    'strict': f'임계값을 최대 {STRICT_MODE_THRESHOLD}으로 낮춰 더 많이 마스킹',
+}
+# 호출별 threshold 허용 범위 (API /api/settings로도 공개)
+THRESHOLD_MIN, THRESHOLD_MAX = 10, 100
+
+def settings_error(threshold: int=None, mode: str=None, use_contextual_analysis: bool=None) -> Optional[str]:
+    """호출별 설정 검사 (None은 기본값 사용, 문제가 없으면 None)"""
+    if threshold is not None and (type(threshold) is not int or not THRESHOLD_MIN <= threshold <= THRESHOLD_MAX):
+        return f"threshold는 {THRESHOLD_MIN}~{THRESHOLD_MAX} 사이의 정수여야 합니다"
+    if mode is not None and mode not in MASKING_MODES:
+        return f"mode는 {', '.join(MASKING_MODES)} 중 하나여야 합니다"
+    if use_contextual_analysis is not None and not isinstance(use_contextual_analysis, bool):
+        return 'use_contextual_analysis는 true 또는 false여야 합니다'
+    return None
+
+@dataclass(frozen=True)
+class ProcessSettings:
+    """호출 단위 처리 설정 (파이프라인 공유 상태를 바꾸지 않고 요청마다 전달)"""
+    threshold: int
+    mode: str = 'medical'
+    use_contextual_analysis: bool = True
+
+    @property
+    def effective_threshold(self) -> int:
+        return min(self.threshold, STRICT_MODE_THRESHOLD) if self.mode == 'strict' else self.threshold
+
 class CompleteMedicalDeidentificationPipeline:
-    def __init__(self, model_path: str=None, threshold: int=50, use_contextual_analysis: bool=True):
+    def __init__(self, model_path: str=None, threshold: int=50, use_contextual_analysis: bool=True,
+                 copula_artifact_path: str=DEFAULT_COPULA_ARTIFACT, combination_rules_path: str=None,
+                 context_window_sentences: int=2, prefilter_margin: int=1,
+                 cache_size: int=1024, cache_ttl: float=300.0, max_sessions: int=256,
+                 sentence_cache_size: int=4096):
         print("🚀 의료 텍스트 비식별화 파이프라인 초기화 중...")
-        self.ner_model = TrainedNERModel(model_path) if model_path else TrainedNERModel("dummy")
-        self.copula_analyzer = CopulaRiskAnalyzer()
-        self.contextual_analyzer = ContextualRiskAnalyzer() if use_contextual_analysis else None
+        self.ner_model = TrainedNERModel(model_path or "dummy", sentence_cache_size=sentence_cache_size)
+        self.copula_analyzer = CopulaRiskAnalyzer(copula_artifact_path)
+        # 호출마다 문맥 분석을 켤 수 있도록 분석기는 항상 만들고, 기본 사용 여부만 보관
+        self.contextual_analyzer = ContextualRiskAnalyzer(combination_rules_path, context_window_sentences)
+        self.use_contextual_analysis = use_contextual_analysis
         self.masking_executor = MaskingExecutor(threshold)
+        self.structured_detector = StructuredPIIDetector()
+        # prefilter_margin=None이면 사전 검사 없이 항상 NER 실행
+        self.prefilter = None
+        if prefilter_margin is not None:
+            self.prefilter = CandidatePrefilter(prefilter_margin, lambda: self.copula_analyzer.gazetteer)
+        # 모델이나 빈도표를 바꾸면 model_version을 갱신하거나 result_cache.clear() 호출
+        self.model_version = self.ner_model.model_path
+        self.result_cache = ResultCache(cache_size, cache_ttl) if cache_size else None
+        # process_incremental용 문서 세션 (오래 쓰지 않은 문서부터 제거)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self.metrics = PipelineMetrics()
         print("✅ 파이프라인 초기화 완료!")
 
-    def process(self, text: str, verbose: bool=True) -> MaskingResult:
+    def resolve_settings(self, threshold: int=None, mode: str=None,
+                         use_contextual_analysis: bool=None) -> ProcessSettings:
+        """호출 인자 중 None인 항목은 파이프라인 기본값으로 채움 (잘못된 값이면 ValueError)"""
+        mode = mode or 'medical'
+        error = settings_error(threshold, mode, use_contextual_analysis)
+        if error:
+            raise ValueError(error)
+        return ProcessSettings(
+            threshold=self.masking_executor.threshold if threshold is None else threshold,
+            mode=mode,
+            use_contextual_analysis=self.use_contextual_analysis if use_contextual_analysis is None else use_contextual_analysis)
+
+    def process(self, text: str, verbose: bool=True, threshold: int=None, mode: str=None,
+                use_contextual_analysis: bool=None) -> MaskingResult:
+        """텍스트 하나 처리 (threshold/mode/use_contextual_analysis는 이번 호출에만 적용)"""
         if verbose: print(f"\n📝 처리할 텍스트: {text}")
-        ner_results = self.ner_model.predict(text)
+        settings = self.resolve_settings(threshold, mode, use_contextual_analysis)
+        start, timings = time.perf_counter(), {}
+        with stage_timer(timings, 'cache'):
+            key = self._cache_key(text, settings)
+            cached = self.result_cache.get(key) if self.result_cache else None
+        if cached is not None:
+            if verbose: print("💾 캐시된 결과 사용")
+            return self._finish(text, cached, timings, start, cache_hit=True)
+        with stage_timer(timings, 'prefilter'):
+            needs_ner = self._needs_ner(text)
+        if not needs_ner:
+            if verbose: print("⏭️  0단계: 개인정보 후보 없음 - NER 생략")
+            ner_results = []
+        else:
+            with stage_timer(timings, 'ner'):
+                ner_results = self.ner_model.predict(text)
+        result = self._run_risk_stages(text, ner_results, verbose, timings, settings)
+        if self.result_cache: self.result_cache.put(key, result)
+        return self._finish(text, result, timings, start, ner_skipped=not needs_ner)
+
+    def process_batch(self, texts: List[str], verbose: bool=False, batch_size: int=32, threshold: int=None,
+                      mode: str=None, use_contextual_analysis: bool=None) -> List[MaskingResult]:
+        """여러 텍스트를 한 번에 처리 (1단계 NER을 배치 추론으로 실행)
+
+        배치 NER 소요 시간은 NER을 실행한 텍스트들에 균등하게 나눠 기록한다.
+        """
+        settings = self.resolve_settings(threshold, mode, use_contextual_analysis)
+        start = time.perf_counter()
+        timings = [{} for _ in texts]
+        keys, cached, candidates = [], [], []
+        for i, text in enumerate(texts):
+            with stage_timer(timings[i], 'cache'):
+                keys.append(self._cache_key(text, settings))
+                cached.append(self.result_cache.get(keys[i]) if self.result_cache else None)
+            if cached[i] is None:
+                with stage_timer(timings[i], 'prefilter'):
+                    if self._needs_ner(text): candidates.append(i)
+        ner_start = time.perf_counter()
+        ner_batch = dict(zip(candidates, self.ner_model.predict_batch([texts[i] for i in candidates], batch_size=batch_size)))
+        for i in candidates:
+            timings[i]['ner'] = (time.perf_counter() - ner_start) * 1000 / len(candidates)
+        results = []
+        for i, text in enumerate(texts):
+            if verbose: print(f"\n📝 처리할 텍스트: {text}")
+            if cached[i] is not None:
+                if verbose: print("💾 캐시된 결과 사용")
+                results.append(self._finish(text, cached[i], timings[i], start, cache_hit=True))
+                continue
+            if i not in ner_batch and verbose:
+                print("⏭️  0단계: 개인정보 후보 없음 - NER 생략")
+            result = self._run_risk_stages(text, ner_batch.get(i, []), verbose, timings[i], settings)
+            if self.result_cache: self.result_cache.put(keys[i], result)
+            results.append(self._finish(text, result, timings[i], start, ner_skipped=i not in ner_batch))
+        return results
+
+    def process_incremental(self, doc_id: str, text: str=None, delta: Dict=None, base_version: int=None,
+                            verbose: bool=False, threshold: int=None, mode: str=None,
+                            use_contextual_analysis: bool=None) -> Tuple[MaskingResult, int]:
+        """편집 중인 문서를 증분 처리하고 (결과, 새 버전) 반환
+
+        text를 주면 문서를 새로 시작하고, 아니면 delta={'start','end','text'}로
+        base_version 시점 텍스트의 [start, end) 구간을 바꾼다. NER은 문장 단위로 실행하며
+        이전 버전에 있던 문장은 저장된 결과를 재사용하고, 2~4단계는 문서 전체에 다시 적용한다.
+        0단계 사전 검사는 process()와 같이 문서 전체에 한 번 적용하므로 같은 텍스트면
+        process()와 결과가 같다.
+        """
+        settings = self.resolve_settings(threshold, mode, use_contextual_analysis)
+        with self._sessions_lock:
+            session = self._sessions.get(doc_id)
+            if text is not None and session is None:
+                session = self._sessions[doc_id] = DocumentSession()
+            if session is not None:
+                self._sessions.move_to_end(doc_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        if session is None:
+            raise StaleDocumentError(f"알 수 없는 문서: {doc_id}")
+
+        start_time, timings = time.perf_counter(), {}
+        with session.lock:
+            if text is None:
+                if delta is None or base_version != session.version:
+                    raise StaleDocumentError(f"문서 버전 불일치: {doc_id} (현재 {session.version}, 요청 {base_version})")
+                if not (isinstance(delta, dict) and isinstance(delta.get('text'), str)
+                        and all(type(delta.get(k)) is int for k in ('start', 'end'))):
+                    raise InvalidEditError("delta는 정수 start, end와 문자열 text가 필요합니다")
+                start, end = delta['start'], delta['end']
+                if not 0 <= start <= end <= len(session.text):
+                    raise InvalidEditError(f"잘못된 편집 범위: [{start}, {end}) (문서 길이 {len(session.text)})")
+                text = session.text[:start] + delta['text'] + session.text[end:]
+
+            spans = split_sentences(text)
+            sentences = [text[start:end] for start, end in spans]
+            with stage_timer(timings, 'prefilter'):
+                needs_ner = self._needs_ner(text)
+            misses = list(dict.fromkeys(s for s in sentences if s not in session.sentence_ner)) if needs_ner else []
+            if verbose: print(f"♻️  NER 재사용 {len(sentences) - len(misses)}문장 / 새로 실행 {len(misses)}문장")
+            with stage_timer(timings, 'ner'):
+                computed = dict(zip(misses, self.ner_model.predict_batch(misses)))
+
+            ner_results, sentence_ner = [], {}
+            for (offset, _), sentence in zip(spans, sentences):
+                rel = session.sentence_ner.get(sentence, computed.get(sentence))
+                if rel is None:
+                    continue
+                sentence_ner[sentence] = rel
+                # 후보가 없는 문서는 저장된 문장 결과가 있어도 process()처럼 NER 결과 없이 처리
+                if needs_ner:
+                    ner_results.extend(replace(r, start_pos=r.start_pos + offset, end_pos=r.end_pos + offset) for r in rel)
+
+            result = self._run_risk_stages(text, ner_results, verbose, timings, settings)
+            session.text, session.sentence_ner = text, sentence_ner
+            session.version += 1
+            return self._finish(text, result, timings, start_time, ner_skipped=not needs_ner), session.version
+
+    def close_document(self, doc_id: str) -> bool:
+        with self._sessions_lock:
+            return self._sessions.pop(doc_id, None) is not None
+
+    def _cache_key(self, text: str, settings: ProcessSettings) -> Tuple:
+        return ResultCache.make_key(text, settings, self.model_version)
+
+    def _needs_ner(self, text: str) -> bool:
+        return self.prefilter is None or self.prefilter.has_candidate(text)
+
+    @staticmethod
+    def _unmasked_result(text: str) -> MaskingResult:
+        return MaskingResult(text, text, [], 0, 0, [(0, len(text), 0, len(text))] if text else [])
+
+    def _run_risk_stages(self, text: str, ner_results: List[NERResult], verbose: bool,
+                         timings: Dict[str, float]=None, settings: ProcessSettings=None) -> MaskingResult:
+        """NER 결과에 구조화 식별자를 합친 뒤 2~4단계(위험도, 문맥, 마스킹) 실행"""
+        timings = {} if timings is None else timings
+        settings = settings or self.resolve_settings()
+        with stage_timer(timings, 'structured'):
+            detections = self.structured_detector.detect(text)
+        if not ner_results and not detections:
+            return self._unmasked_result(text)
         if verbose: print(f"🔍 1단계 NER 결과: {[(r.token, r.entity) for r in ner_results]}")
-        risk_weights = self.copula_analyzer.calculate_risk_weights(ner_results)
+        if detections:
+            ner_results = self.structured_detector.merge(ner_results, detections)
+            if verbose: print(f"🔢 1-1단계 구조화 식별자: {[(r.token, r.entity) for r in detections]}")
+        with stage_timer(timings, 'copula'):
+            risk_weights = self.copula_analyzer.calculate_risk_weights(ner_results)
         if verbose: print(f"📊 2단계 위험도: {[(r.token,r.risk_weight) for r in risk_weights if r.risk_weight>0]}")
-        if self.contextual_analyzer:
-            risk_weights = self.contextual_analyzer.analyze_contextual_risk(text, risk_weights)
+        if settings.use_contextual_analysis:
+            with stage_timer(timings, 'contextual'):
+                risk_weights = self.contextual_analyzer.analyze_contextual_risk(
+                    text, risk_weights, use_keywords=settings.mode != 'general')
             if verbose: print(f"🔄 3단계 조정된 위험도: {[(r.token,r.risk_weight) for r in risk_weights if r.risk_weight>0]}")
-        result = self.masking_executor.execute_masking(text, risk_weights)
+        with stage_timer(timings, 'masking'):
+            result = self.masking_executor.execute_masking(text, risk_weights, settings.effective_threshold)
         if verbose: print(f"🎭 4단계 마스킹 결과: {result.masked_text}")
         return result
 
+    def _finish(self, text: str, result: MaskingResult, timings: Dict[str, float], start: float,
+                cache_hit: bool=False, ner_skipped: bool=False) -> MaskingResult:
+        """요청 전체 시간을 더해 결과에 단계별 시간을 붙이고 집계에 반영
+
+        캐시된 결과 객체는 여러 요청이 공유하므로 복사본에 이번 요청의 시간을 붙인다.
+        """
+        timings['total'] = (time.perf_counter() - start) * 1000
+        self.metrics.record(timings, {
+            'requests': 1, 'cache_hits': int(cache_hit), 'ner_skipped': int(ner_skipped),
+            'characters': len(text), 'words': len(text.split()),
+            'entities': result.total_entities, 'masked_entities': result.masked_entities,
+        })
+        return replace(result, stage_timings=timings)
+
     def print_detailed_analysis(self, result: MaskingResult):
         print("\n"+"="*80)
         print("🏥 의료 텍스트 비식별화 분석 결과")
@@ -293,6 +1528,13 @@ class CompleteMedicalDeidentificationPipeline:
             print("\n✅ 마스킹이 필요한 고위험 정보가 없습니다.")
 
 # ================== 테스트 실행 ==================
+SAMPLE_TEXTS = [
+    "김철수씨가 2023년 10월에 서울대병원에서 간암 진단을 받았습니다.",
+    "박영희(010-1234-5678)는 삼성서울병원에서 수술을 받았다.",
+    "환자는 내일 검사를 받을 예정입니다.",
+    "이순신 교수는 연세의료원에서 백혈병 연구를 하고 있다."
+]
+
 def main():
     print("🚀 완전한 의료 텍스트 비식별화 파이프라인 테스트")
     # 변경된 model_path 지정
@@ -303,14 +1545,7 @@ def main():
         use_contextual_analysis=True
     )
 
-    test_cases = [
-        "김철수씨가 2023년 10월에 서울대병원에서 간암 진단을 받았습니다.",
-        "박영희(010-1234-5678)는 삼성서울병원에서 수술을 받았다.",
-        "환자는 내일 검사를 받을 예정입니다.",
-        "이순신 교수는 연세의료원에서 백혈병 연구를 하고 있다."
-    ]
-
-    for i, text in enumerate(test_cases, 1):
+    for i, text in enumerate(SAMPLE_TEXTS, 1):
         print(f"\n{'='*20} 테스트 {i} {'='*20}")
         result = pipeline.process(text, verbose=True)
         pipeline.print_detailed_analysis(result)
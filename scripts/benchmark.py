@@ -0,0 +1,311 @@
+"""
+Privacy Guard LLM - 파이프라인 성능 벤치마크
+
+사용법:
+    python scripts/benchmark.py --mode ner --model-path ner-koelectra-lora-merged
+    python scripts/benchmark.py --mode ner --num-inputs 10000 --batch-size 64
+    python scripts/benchmark.py --mode masking --text-size 1000000 --num-entities 5000
+    python scripts/benchmark.py --mode copula-startup
+    python scripts/benchmark.py --mode copula-scaling
+    python scripts/benchmark.py --mode prefilter
+    python scripts/benchmark.py --mode structured --text-size 1000000
+    python scripts/benchmark.py --mode shared-cache --workers 4 --trace requests.jsonl
+"""
+
+import re
+import sys
+import copy
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+import tracemalloc
+from pathlib import Path
+
+# 상위 디렉토리의 masking_module, tests/의 테스트 케이스 import
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "tests"))
+sys.path.append(str(Path(__file__).parent.parent / "server"))
+
+from masking_module import (TrainedNERModel, CopulaRiskAnalyzer, CandidatePrefilter, MaskingExecutor,
+                            StructuredPIIDetector, ResultCache, NERResult, RiskWeight, PREFILTER_PATTERNS, SAMPLE_TEXTS)
+
+def scaled_inputs(num_inputs: int):
+    """main() 테스트 케이스를 num_inputs개로 확장"""
+    repeat = num_inputs // len(SAMPLE_TEXTS) + 1
+    return (SAMPLE_TEXTS * repeat)[:num_inputs]
+
+def count_real_tokens(ner_model: TrainedNERModel, texts):
+    """패딩을 제외한 실제 서브워드 토큰 수"""
+    enc = ner_model.tokenizer([t.split() for t in texts], is_split_into_words=True,
+                              truncation=True, max_length=ner_model.max_length)
+    return sum(len(ids) for ids in enc['input_ids'])
+
+def legacy_predict(ner_model: TrainedNERModel, sentence: str):
+    """기존 방식: 문장 하나씩 max_length=128 고정 패딩"""
+    import torch
+    enc = ner_model.tokenizer(sentence.split(), is_split_into_words=True,
+                              return_tensors="pt", padding="max_length",
+                              truncation=True, max_length=128)
+    with torch.no_grad():
+        return ner_model.model(**enc).logits.argmax(-1)
+
+def bench_ner(args):
+    """NER 처리량 비교: 고정 패딩 vs 동적 패딩 vs 동적 패딩 + 길이 버킷팅 vs + 문장 캐시"""
+    ner_model = TrainedNERModel(args.model_path, sentence_cache_size=0)
+    if ner_model.model is None:
+        print("❌ 실제 모델이 로드되지 않아 NER 벤치마크를 실행할 수 없습니다 (--model-path 확인)")
+        return
+
+    texts = scaled_inputs(args.num_inputs)
+    total_tokens = count_real_tokens(ner_model, texts)
+    print(f"📊 입력: {len(texts)}개 문장, 실제 토큰 {total_tokens}개, 배치 크기 {args.batch_size}")
+
+    runs = {
+        '고정 패딩(문장 단위)': lambda: [legacy_predict(ner_model, t) for t in texts],
+        '동적 패딩(배치)': lambda: ner_model.predict_batch(texts, batch_size=args.batch_size,
+                                                         bucket_by_length=False),
+        '동적 패딩 + 길이 버킷팅': lambda: ner_model.predict_batch(texts, batch_size=args.batch_size,
+                                                              bucket_by_length=True),
+        '+ 문장 캐시': lambda: cached_model.predict_batch(texts, batch_size=args.batch_size),
+    }
+    # 같은 가중치를 공유하고 문장 캐시만 켠 모델
+    cached_model = copy.copy(ner_model)
+    cached_model.sentence_cache = ResultCache(args.num_inputs, ttl=None)
+
+    print(f"\n{'방식':<24} {'소요시간(s)':>12} {'tokens/sec':>12}")
+    print("-" * 50)
+    for name, run in runs.items():
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {elapsed:>12.2f} {total_tokens / elapsed:>12.0f}")
+    print(f"\n💾 문장 캐시 적중률: {cached_model.sentence_cache.stats()['hit_rate']:.1%}")
+
+def build_masking_input(text_size: int, num_entities: int):
+    """text_size 문자 길이의 노트와 위치가 지정된 num_entities개 개체 생성"""
+    rng = random.Random(42)
+    names = ['김철수', '박영희', '이순신', '최민수', '정하늘']
+    filler = "환자는 내일 검사를 받을 예정입니다. "
+    gap = max(text_size // num_entities - 4, 1)
+
+    parts, risk_weights, pos = [], [], 0
+    for _ in range(num_entities):
+        chunk = (filler * (gap // len(filler) + 1))[:gap]
+        name = rng.choice(names)
+        parts.extend([chunk, name])
+        pos += len(chunk)
+        risk_weights.append(RiskWeight(name, 'B-PER', '직접', 100, None, pos, pos + len(name)))
+        pos += len(name)
+    return "".join(parts), risk_weights
+
+def legacy_masking(executor: MaskingExecutor, text: str, risk_weights):
+    """기존 방식: 위험도 순으로 정렬 후 개체마다 str.replace"""
+    masked_text = text
+    for rw in sorted(risk_weights, key=lambda x: x.risk_weight, reverse=True):
+        if rw.risk_weight >= executor.threshold and rw.entity != 'O':
+            pat = executor.mask_patterns.get(rw.entity[2:], executor.mask_patterns['default'])
+            if rw.token in masked_text:
+                masked_text = masked_text.replace(rw.token, pat, 1)
+    return masked_text
+
+def bench_masking(args):
+    """마스킹 단계 비교: 개체별 str.replace vs 구간 기반 단일 패스"""
+    executor = MaskingExecutor(threshold=50)
+    text, risk_weights = build_masking_input(args.text_size, args.num_entities)
+    print(f"📊 입력: {len(text)}자, 개체 {len(risk_weights)}개")
+
+    runs = {
+        'str.replace 반복': lambda: legacy_masking(executor, text, risk_weights),
+        '구간 기반 단일 패스': lambda: executor.execute_masking(text, risk_weights).masked_text,
+    }
+
+    print(f"\n{'방식':<24} {'소요시간(ms)':>14}")
+    print("-" * 40)
+    for name, run in runs.items():
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {elapsed * 1000:>14.1f}")
+
+def bench_copula_startup(args):
+    """CopulaRiskAnalyzer 콜드 스타트: 매번 fit vs 저장된 아티팩트 로드"""
+    start = time.perf_counter()
+    analyzer = CopulaRiskAnalyzer()
+    fit_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as path:
+        analyzer.save_artifact(path)
+        start = time.perf_counter()
+        CopulaRiskAnalyzer(artifact_path=path)
+        load_time = time.perf_counter() - start
+
+    print(f"\n{'방식':<24} {'소요시간(ms)':>14}")
+    print("-" * 40)
+    print(f"{'fit + sample':<24} {fit_time * 1000:>14.1f}")
+    print(f"{'아티팩트 로드(mmap)':<24} {load_time * 1000:>14.1f}")
+
+def bench_copula_scaling(args):
+    """범주 수(1k/10k/100k)에 따른 copula 피처 공간 메모리와 위험도 질의 지연시간"""
+    import numpy as np
+    import pandas as pd
+
+    print(f"\n{'범주 수':>8} {'원-핫 샘플(MB)':>16} {'코드+CSR(MB)':>14} {'추가 할당(MB)':>14} {'질의(us)':>10}")
+    print("-" * 68)
+    for num_categories in (1_000, 10_000, 100_000):
+        analyzer = CopulaRiskAnalyzer(artifact_path=args.copula_artifact)
+        values = [f"병원{i:06d}" for i in range(num_categories)]
+        # Zipf 형태의 기관별 빈도
+        table = pd.Series(1_000_000 / np.arange(1, num_categories + 1), index=values)
+
+        tracemalloc.start()
+        analyzer.update_frequency_table('기관', table, replace=True)
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        codes_bytes = analyzer._sample_codes.nbytes + analyzer._uniforms.nbytes + sum(
+            m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in analyzer._postings.values())
+        # 기존 방식: get_dummies float64 컬럼이 범주마다 하나씩
+        total_columns = sum(len(v) for v in analyzer.categories.values())
+        dense_bytes = analyzer.num_samples * total_columns * 8
+
+        rng = random.Random(0)
+        queries = [[NERResult(rng.choice(values), 'B-ORG'), NERResult('간암', 'B-DISEASE'),
+                    NERResult('2023년', 'B-DATE')] for _ in range(1000)]
+        start = time.perf_counter()
+        for ner_results in queries:
+            analyzer.calculate_risk_weights(ner_results)
+        per_query = (time.perf_counter() - start) / len(queries)
+
+        print(f"{num_categories:>8} {dense_bytes / 1e6:>16.1f} {codes_bytes / 1e6:>14.2f} "
+              f"{allocated / 1e6:>14.2f} {per_query * 1e6:>10.1f}")
+
+def bench_prefilter(args):
+    """사전 검사 단계가 NER을 건너뛰는 비율 (TestCases.get_all_cases 기준)"""
+    from test_cases import TestCases
+
+    cases = TestCases.get_all_cases()
+    copula = CopulaRiskAnalyzer(artifact_path=args.copula_artifact)
+
+    print(f"📊 입력: {len(cases)}개 케이스")
+    print(f"\n{'재현율 단계':<10} {'건너뜀':>8} {'비율':>8} {'텍스트당(us)':>14}")
+    print("-" * 44)
+    skipped_by_margin = {}
+    for margin in range(len(PREFILTER_PATTERNS)):
+        prefilter = CandidatePrefilter(margin, lambda: copula.gazetteer)
+        start = time.perf_counter()
+        skipped = [c for c in cases if not prefilter.has_candidate(c['text'])]
+        elapsed = (time.perf_counter() - start) / len(cases)
+        skipped_by_margin[margin] = skipped
+        print(f"{margin:<10} {len(skipped):>8} {len(skipped) / len(cases):>8.1%} {elapsed * 1e6:>14.1f}")
+
+    for margin, skipped in skipped_by_margin.items():
+        print(f"\n[단계 {margin}] NER 생략 케이스:")
+        for case in skipped:
+            print(f"  - ({case['expected_risk']}) {case['text']}")
+
+    # 기본 단계(1)에서 패턴별로 몇 케이스에 걸리는지, 그 패턴만 빼면 새로 생략될 케이스가 몇 개인지
+    patterns = {name: re.compile(p) for tier in PREFILTER_PATTERNS[:2] for name, p in tier.items()}
+    matches = [{name for name, p in patterns.items() if p.search(c['text'])} |
+               ({'gazetteer'} if copula.gazetteer.search(c['text']) else set()) for c in cases]
+    benign = [bool(m) and c['expected_risk'] in ('LOW', 'NONE') for c, m in zip(cases, matches)]
+    print(f"\n[단계 1] 패턴별 적중 (LOW/NONE 케이스 중 NER을 못 건너뛴 것: {sum(benign)}개)")
+    print(f"{'패턴':<12} {'적중':>6} {'LOW/NONE':>9} {'단독 적중':>10}")
+    for name in [*patterns, 'gazetteer']:
+        hit = [i for i, m in enumerate(matches) if name in m]
+        sole = [i for i in hit if matches[i] == {name}]
+        print(f"{name:<12} {len(hit):>6} {sum(benign[i] for i in hit):>9} {len(sole):>10}"
+              + (f"  ← 단독: {', '.join(cases[i]['expected_risk'] for i in sole)}" if sole else ""))
+
+def bench_structured(args):
+    """구조화 식별자 탐지 비용 (KB당 마이크로초)"""
+    detector = StructuredPIIDetector()
+    text = (" ".join(SAMPLE_TEXTS) + " ") * (args.text_size // len(" ".join(SAMPLE_TEXTS)) + 1)
+    text = text[:args.text_size]
+
+    start = time.perf_counter()
+    detections = detector.detect(text)
+    elapsed = time.perf_counter() - start
+    print(f"📊 입력: {len(text)}자, 탐지 {len(detections)}개")
+    print(f"⏱️  {elapsed * 1000:.1f}ms ({elapsed * 1e6 / (len(text.encode()) / 1024):.1f}us/KB)")
+
+def load_trace(args):
+    """요청 트레이스 로드 (JSONL의 text 필드, 없으면 Zipf 분포로 반복되는 합성 트레이스)"""
+    if args.trace:
+        import json
+        with open(args.trace, encoding='utf-8') as f:
+            return [json.loads(line)['text'] for line in f if line.strip()]
+
+    import numpy as np
+    rng = np.random.default_rng(0)
+    names, hospitals = ['김철수', '박영희', '이순신', '최민수', '정하늘'], ['서울대병원', '삼성서울병원', '연세의료원', '아산병원', '고려대병원']
+    diseases, years = ['간암', '당뇨병', '폐렴', '백혈병', '고혈압'], ['2021년', '2022년', '2023년', '2024년', '2025년']
+    unique = [f"{n}씨가 {y}에 {h}에서 {d} 진단을 받았습니다." for n in names for h in hospitals for d in diseases for y in years]
+    weights = 1 / np.arange(1, len(unique) + 1) ** 1.1
+    return [unique[i] for i in rng.choice(len(unique), size=args.num_inputs, p=weights / weights.sum())]
+
+def _shared_cache_worker(model_path, cache_path, texts, barrier, results):
+    from model_manager import ModelManager
+
+    manager = ModelManager(model_path=model_path, shared_cache_path=cache_path, micro_batching=False)
+    barrier.wait()
+    start = time.perf_counter()
+    for text in texts:
+        manager.process_text(text)
+    elapsed = time.perf_counter() - start
+    # 공유 캐시 적중은 파이프라인까지 오지 않으므로 프로세스 캐시 미스 = 전체 파이프라인 실행 수
+    results.put((elapsed, manager.pipeline.result_cache.misses))
+
+def bench_shared_cache(args):
+    """워커 N개가 트레이스를 나눠 재생할 때 프로세스 캐시만 vs 프로세스 + SQLite 공유 캐시"""
+    trace = load_trace(args)
+    print(f"📊 트레이스: {len(trace)}개 요청, 고유 텍스트 {len(set(trace))}개, 워커 {args.workers}개")
+
+    ctx = multiprocessing.get_context('fork')
+    print(f"\n{'방식':<24} {'소요시간(s)':>12} {'req/sec':>10} {'파이프라인 실행':>16}")
+    print("-" * 66)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cache_path in [('프로세스 캐시만', None), ('+ SQLite 공유 캐시', str(Path(tmp) / 'cache.db'))]:
+            barrier, results = ctx.Barrier(args.workers + 1), ctx.Queue()
+            workers = [ctx.Process(target=_shared_cache_worker,
+                                   args=(args.model_path, cache_path, trace[i::args.workers], barrier, results))
+                       for i in range(args.workers)]
+            for w in workers:
+                w.start()
+            barrier.wait()
+            outcomes = [results.get() for _ in workers]
+            for w in workers:
+                w.join()
+            elapsed = max(t for t, _ in outcomes)
+            runs = sum(n for _, n in outcomes)
+            print(f"{name:<24} {elapsed:>12.2f} {len(trace) / elapsed:>10.0f} {runs:>16}")
+
+def main():
+    """메인 함수"""
+    parser = argparse.ArgumentParser(description='Privacy Guard LLM - 파이프라인 벤치마크')
+    parser.add_argument('--mode', choices=['ner', 'masking', 'copula-startup', 'copula-scaling', 'prefilter', 'structured', 'shared-cache'], default='ner', help='벤치마크 모드')
+    parser.add_argument('--model-path', default='ner-koelectra-lora-merged', help='NER 모델 경로')
+    parser.add_argument('--num-inputs', type=int, default=10000, help='입력 문장 수')
+    parser.add_argument('--batch-size', type=int, default=32, help='배치 크기')
+    parser.add_argument('--text-size', type=int, default=1_000_000, help='마스킹 벤치마크 텍스트 길이(문자)')
+    parser.add_argument('--num-entities', type=int, default=5000, help='마스킹 벤치마크 개체 수')
+    parser.add_argument('--copula-artifact', default=None, help='copula 아티팩트 경로 (없으면 fit)')
+    parser.add_argument('--workers', type=int, default=4, help='공유 캐시 벤치마크 워커 수')
+    parser.add_argument('--trace', default=None, help='재생할 요청 트레이스 (JSONL, text 필드)')
+
+    args = parser.parse_args()
+
+    modes = {
+        'ner': bench_ner,
+        'masking': bench_masking,
+        'copula-startup': bench_copula_startup,
+        'copula-scaling': bench_copula_scaling,
+        'prefilter': bench_prefilter,
+        'structured': bench_structured,
+        'shared-cache': bench_shared_cache,
+    }
+    modes[args.mode](args)
+
+if __name__ == "__main__":
+    main()
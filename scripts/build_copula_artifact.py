@@ -0,0 +1,45 @@
+"""
+Copula 위험도 모델 아티팩트 빌드 (오프라인 단계)
+
+사용법:
+    python scripts/build_copula_artifact.py
+    python scripts/build_copula_artifact.py --output artifacts/copula
+    python scripts/build_copula_artifact.py --table freq/hospitals.parquet --table 질병=freq/icd10.csv
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# 상위 디렉토리의 masking_module import
+sys.path.append(str(Path(__file__).parent.parent))
+
+from masking_module import CopulaRiskAnalyzer, load_frequency_table, DEFAULT_COPULA_ARTIFACT, COPULA_ARTIFACT_VERSION
+
+def main():
+    """메인 함수"""
+    parser = argparse.ArgumentParser(description='Copula 위험도 모델 아티팩트 빌드')
+    parser.add_argument('--output', default=DEFAULT_COPULA_ARTIFACT, help='아티팩트 저장 디렉토리')
+    parser.add_argument('--table', action='append', default=[],
+                        help='빈도표 CSV/Parquet (attribute,value,count) 또는 속성=경로 (value,count)')
+    parser.add_argument('--base', default=None, help='증분 갱신할 기존 아티팩트 (없으면 새로 fit)')
+    args = parser.parse_args()
+
+    print(f"🔄 Copula 모델 fit 중... (아티팩트 버전 {COPULA_ARTIFACT_VERSION})")
+    start = time.perf_counter()
+    analyzer = CopulaRiskAnalyzer(artifact_path=args.base)
+    print(f"✅ fit 완료: {time.perf_counter() - start:.2f}초")
+
+    for spec in args.table:
+        attribute, _, path = spec.rpartition('=')
+        for attr, table in load_frequency_table(path, attribute or None).items():
+            start = time.perf_counter()
+            analyzer.update_frequency_table(attr, table)
+            print(f"📊 빈도표 반영: {attr} ({len(table)}개 범주, {time.perf_counter() - start:.2f}초)")
+
+    analyzer.save_artifact(args.output)
+    print(f"💾 아티팩트 저장: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Privacy Guard LLM - /api/mask 부하 테스트
+
+사용법:
+    python scripts/load_test.py --model-path ner-koelectra-lora-merged --compare
+    python scripts/load_test.py --requests 5000 --concurrency 32 --max-batch-size 32 --max-wait-ms 10
+    python scripts/load_test.py --server asgi --concurrency 64
+    python scripts/load_test.py --prefork-workers 1,2,4,8 --concurrency 64
+    python scripts/load_test.py --url http://localhost:8000 --concurrency 16
+
+--url을 주지 않으면 같은 프로세스에서 서버를 띄워 측정한다.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# server/ 모듈 import
+sys.path.append(str(Path(__file__).parent.parent / "server"))
+
+def build_requests(num_requests: int):
+    """결과 캐시에 걸리지 않도록 요청마다 다른 텍스트 생성"""
+    rng = random.Random(0)
+    names = ['김철수', '박영희', '이순신', '최민수', '정하늘']
+    hospitals = ['서울대병원', '삼성서울병원', '연세의료원', '아산병원', '고려대병원']
+    diseases = ['간암', '당뇨병', '폐렴', '백혈병', '고혈압']
+    return [f"{rng.choice(names)}씨가 {2000 + i % 25}년 {1 + i % 12}월에 {rng.choice(hospitals)}에서 "
+            f"{rng.choice(diseases)} 진단을 받았습니다. 접수번호 {i}."
+            for i in range(num_requests)]
+
+def start_local_server(args, micro_batching: bool, server_type: str = 'flask'):
+    """설정을 바꿔 같은 프로세스에서 서버 실행 후 (주소, 종료 함수) 반환"""
+    import config
+
+    config.MICRO_BATCH_ENABLED = micro_batching
+    config.MICRO_BATCH_MAX_SIZE = args.max_batch_size
+    config.MICRO_BATCH_MAX_WAIT_MS = args.max_wait_ms
+
+    if server_type == 'asgi':
+        import socket
+        import uvicorn
+        from model_manager import ModelManager
+        from asgi_app import create_asgi_app
+
+        model_manager = ModelManager(args.model_path)
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server = uvicorn.Server(uvicorn.Config(
+            create_asgi_app(model_manager, max_workers=2 * args.max_batch_size), log_level='warning'))
+        threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+
+        def shutdown():
+            server.should_exit = True
+        return f"http://127.0.0.1:{sock.getsockname()[1]}", shutdown
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app()
+    if args.model_path:
+        app.model_manager.load_model(args.model_path)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+def post_mask(url: str, text: str):
+    """요청 하나를 보내고 (지연시간, 거절 여부) 반환 (429는 거절로 집계)"""
+    body = json.dumps({'text': text}).encode()
+    req = urllib.request.Request(f"{url}/api/mask", data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as resp:
+            resp.read()
+    except urllib.error.HTTPError as e:
+        if e.code != 429:
+            raise
+        return time.perf_counter() - start, True
+    return time.perf_counter() - start, False
+
+def run_load(url: str, texts, concurrency: int):
+    """concurrency개 클라이언트로 요청을 모두 보내고 (성공 지연시간 목록, 거절 수, 전체 소요시간) 반환"""
+    post_mask(url, "워밍업 요청입니다.")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda t: post_mask(url, t), texts))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([latency for latency, rejected in results if not rejected])
+    return latencies, len(results) - len(latencies), elapsed
+
+def print_row(name: str, latencies, rejected: int, elapsed: float):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{name:<20} {len(latencies) / elapsed:>10.1f} {p50:>10.1f} {p99:>10.1f} {rejected:>8}")
+
+def run_prefork(args, texts):
+    """모델을 한 번 로드하고 워커 수별로 prefork 서버를 띄워 처리량과 워커 메모리 측정"""
+    import socket
+    import torch
+    import config
+    from model_manager import ModelManager
+    from prefork import PreforkServer
+
+    config.MICRO_BATCH_MAX_SIZE = args.max_batch_size
+    config.MICRO_BATCH_MAX_WAIT_MS = args.max_wait_ms
+    torch.set_num_threads(1)
+    model_manager = ModelManager(args.model_path, micro_batching=False)
+
+    print(f"\n{'워커':>4} {'스레드':>6} {'req/sec':>10} {'p50(ms)':>10} {'p99(ms)':>10} "
+          f"{'RSS/워커':>10} {'PSS/워커':>10} {'USS/워커':>10} {'PSS 합계':>10}  (MB)")
+    print("-" * 96)
+    for workers in map(int, args.prefork_workers.split(',')):
+        sock = socket.create_server(('127.0.0.1', 0), backlog=2048)
+        server = PreforkServer(model_manager, sock, workers, server_type=args.server)
+        server.start()
+        try:
+            latencies, rejected, elapsed = run_load(f"http://127.0.0.1:{sock.getsockname()[1]}", texts,
+                                                    args.concurrency)
+            memory = list(server.memory().values())
+        finally:
+            server.stop()
+            sock.close()
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        rss, pss, uss = (np.mean([m[k] for m in memory]) / 1024 for k in ('rss', 'pss', 'uss'))
+        print(f"{workers:>4} {server.threads_per_worker:>6} {len(latencies) / elapsed:>10.1f} {p50:>10.1f} "
+              f"{p99:>10.1f} {rss:>10.1f} {pss:>10.1f} {uss:>10.1f} {pss * workers:>10.1f}")
+
+def main():
+    """메인 함수"""
+    parser = argparse.ArgumentParser(description='Privacy Guard LLM - /api/mask 부하 테스트')
+    parser.add_argument('--url', default=None, help='대상 서버 주소 (없으면 프로세스 내 서버 실행)')
+    parser.add_argument('--model-path', default=None, help='NER 모델 경로 (프로세스 내 서버용)')
+    parser.add_argument('--requests', type=int, default=2000, help='전체 요청 수')
+    parser.add_argument('--concurrency', type=int, default=16, help='동시 클라이언트 수')
+    parser.add_argument('--max-batch-size', type=int, default=16, help='마이크로 배치 최대 크기')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='마이크로 배치 최대 대기 시간(ms)')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask', help='프로세스 내 서버 종류')
+    parser.add_argument('--prefork-workers', default=None,
+                        help='prefork 서버 워커 수 목록 (예: 1,2,4,8) - 워커 수별 처리량/메모리 측정')
+    parser.add_argument('--compare', action='store_true',
+                        help='Flask 마이크로 배칭 끔/켬과 ASGI 비교 (프로세스 내 서버만)')
+
+    args = parser.parse_args()
+    texts = build_requests(args.requests)
+
+    print(f"📊 요청 {len(texts)}개, 동시 클라이언트 {args.concurrency}개")
+    if args.prefork_workers:
+        run_prefork(args, texts)
+        return
+    print(f"\n{'방식':<20} {'req/sec':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'429':>8}")
+    print("-" * 63)
+
+    if args.url:
+        print_row(args.url, *run_load(args.url, texts, args.concurrency))
+        return
+
+    if args.compare:
+        configs = [('Flask 요청별 처리', False, 'flask'), ('Flask 마이크로 배칭', True, 'flask'),
+                   ('ASGI 마이크로 배칭', True, 'asgi')]
+    else:
+        configs = [(f"{args.server.upper()} 마이크로 배칭", True, args.server)]
+    for name, micro_batching, server_type in configs:
+        url, shutdown = start_local_server(args, micro_batching, server_type)
+        try:
+            print_row(name, *run_load(url, texts, args.concurrency))
+        finally:
+            shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# scripts/test_integration.py
+"""
+Privacy Guard LLM - 통합 점검 (pytest)
+
+모델 파일 없이 더미 NER 모델로 서버 경로와 구조화 PII 탐지를 점검한다.
+
+실행:
+    HF_HUB_OFFLINE=1 python -m pytest -q scripts/test_integration.py
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'server'))
+
+def _json(response):
+    # Flask 테스트 응답은 get_json(), Starlette(httpx) 응답은 json()
+    return response.get_json() if hasattr(response, 'get_json') else response.json()
+
+@pytest.fixture(scope='module')
+def model_manager():
+    from model_manager import ModelManager
+    # 없는 경로를 주면 더미 NER 모델로 로드됨
+    return ModelManager(os.path.join(ROOT, 'no-such-model'), micro_batching=False)
+
+@pytest.fixture
+def asgi_client(model_manager):
+    starlette_testclient = pytest.importorskip('starlette.testclient')
+    from asgi_app import create_asgi_app
+    with starlette_testclient.TestClient(create_asgi_app(model_manager)) as client:
+        yield client
+
+# ================== 구조화 식별자 탐지 ==================
+AWS_KEY = 'AKIA' + 'ABCDEFGHIJ234567'
+OPENAI_KEY = 'sk-proj-' + 'a1B2c3D4e5F6g7H8i9J0kL'
+
+def _detect(text):
+    from masking_module import StructuredPIIDetector
+    return [(r.entity, r.token) for r in StructuredPIIDetector().detect(text)]
+
+def test_rrn_checksum():
+    from masking_module import _rrn_valid, _rrn_date_valid
+    assert _rrn_valid('9001011234568')
+    assert not _rrn_valid('9001011234567')
+    assert _rrn_date_valid('9001011234567')
+    assert not _rrn_date_valid('9013011234568')
+    assert not _rrn_date_valid('9001321234568')
+
+def test_luhn():
+    from masking_module import _luhn_valid
+    assert _luhn_valid('4111111111111111')
+    assert _luhn_valid('4222222222222')
+    assert not _luhn_valid('4111111111111112')
+    assert not _luhn_valid('411111111111')        # 12자리
+    assert not _luhn_valid('41111111111111111111')  # 20자리
+
+@pytest.mark.parametrize('text, expected', [
+    ('주민번호 900101-1234568입니다', [('B-RRN', '900101-1234568')]),
+    ('주민번호 9001011234567입니다', [('B-RRN_UNVERIFIED', '9001011234567')]),
+    ('번호 9013011234567', []),
+    ('카드 4222222222222로 결제', [('B-CARD', '4222222222222')]),
+    ('카드 4111-1111-1111-1111 결제', [('B-CARD', '4111-1111-1111-1111')]),
+    ('카드 4111-1111-1111-1112 결제', []),
+    ('연락처는abc@naver.com입니다', [('B-EMAIL', 'abc@naver.com')]),
+    ('전화 010-1234-5678로', [('B-CONTACT', '010-1234-5678')]),
+    (f'키는 {OPENAI_KEY}입니다', [('B-API_KEY', OPENAI_KEY)]),
+    (f'{AWS_KEY}입니다', [('B-API_KEY', AWS_KEY)]),
+    (f'x{AWS_KEY}', []),
+    (f'{AWS_KEY}Q', []),
+])
+def test_structured_detector(text, expected):
+    assert _detect(text) == expected
+
+# ================== ASGI 서버 ==================
+def test_asgi_mask_model_not_loaded_returns_fallback(asgi_client, model_manager):
+    model_manager.model_info['loaded'] = False
+    try:
+        response = asgi_client.post('/api/mask', json={'text': '김철수씨가 입원했다'})
+    finally:
+        model_manager.model_info['loaded'] = True
+    assert response.status_code == 500
+    body = response.json()
+    assert body['success'] is False
+    assert body['fallback'] is True
+    assert body['error'] == 'Model not loaded'
+    assert 'fallback' in body['message']
+
+def test_asgi_mask_pipeline_error_returns_json(asgi_client, model_manager, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(model_manager.pipeline, 'process', fail)
+    response = asgi_client.post('/api/mask', json={'text': '김철수씨가 입원했다'})
+    assert response.status_code == 500
+    assert response.json()['error'] == 'boom'
+    assert response.json()['fallback'] is True
+
+def test_asgi_batch_stream_holds_one_slot(model_manager):
+    starlette_testclient = pytest.importorskip('starlette.testclient')
+    from asgi_app import create_asgi_app
+    app = create_asgi_app(model_manager, max_workers=1, max_queue=1)
+    pool = app.state.pool
+    with starlette_testclient.TestClient(app) as client:
+        pool.acquire()
+        pool.acquire()
+        try:
+            response = client.post('/api/mask/batch', json=['김철수씨가 입원했다'])
+            assert response.status_code == 429
+            assert response.headers['Retry-After']
+        finally:
+            pool.release()
+            pool.release()
+
+        response = client.post('/api/mask/batch?batch_size=1', json=['김철수씨가 입원했다', '박영희 교수'])
+        assert response.status_code == 200
+        assert response.text.splitlines()[-1] == '{"done": true, "count": 2}'
+        # 스트림이 끝나면 확보한 슬롯을 반환
+        assert pool.stats()['pending'] == 0
+
+# ================== 대량 마스킹 ==================
+@pytest.fixture
+def flask_client(model_manager):
+    pytest.importorskip('flask')
+    from app import create_app
+    return create_app(model_manager).test_client()
+
+@pytest.mark.parametrize('query', ['batch_size=abc', 'batch_size=0', 'batch_size=-3', 'threshold=abc'])
+def test_batch_rejects_bad_params(flask_client, asgi_client, query):
+    for client in (flask_client, asgi_client):
+        response = client.post(f'/api/mask/batch?{query}', json=['김철수씨가 입원했다'])
+        assert response.status_code == 400
+
+def test_batch_size_is_capped(model_manager, monkeypatch):
+    import config
+    monkeypatch.setattr(config, 'BATCH_MAX_SIZE', 2)
+    seen = []
+    process_batch = model_manager.pipeline.process_batch
+    def record(texts, **kwargs):
+        seen.append((len(texts), kwargs['batch_size']))
+        return process_batch(texts, **kwargs)
+    monkeypatch.setattr(model_manager.pipeline, 'process_batch', record)
+    docs = [(i, f'환자 {i} 김철수') for i in range(5)]
+    results = list(model_manager.process_documents(docs, batch_size=1_000_000))
+    assert [r['id'] for r in results] == list(range(5))
+    assert seen == [(2, config.NER_BATCH_SIZE), (2, config.NER_BATCH_SIZE), (1, config.NER_BATCH_SIZE)]
+
+# ================== 요청별 설정 ==================
+@pytest.mark.parametrize('settings', [
+    {'threshold': 'abc'}, {'threshold': 5}, {'threshold': 50.5}, {'threshold': True},
+    {'mode': 'bad'}, {'use_contextual_analysis': 'false'}, {'use_contextual_analysis': 1},
+])
+def test_bad_settings_return_400(flask_client, asgi_client, settings):
+    for client in (flask_client, asgi_client):
+        for path, body in (('/api/mask', {'text': '김철수씨가 입원했다'}),
+                           ('/api/mask/incremental', {'doc_id': 'settings', 'text': '김철수씨가 입원했다'})):
+            response = client.post(path, json={**body, **settings})
+            assert response.status_code == 400, (path, settings)
+            assert 'fallback' not in _json(response)
+
+@pytest.mark.parametrize('query', ['mode=bad', 'use_contextual_analysis=maybe', 'threshold=500'])
+def test_batch_bad_settings_return_400(flask_client, asgi_client, query):
+    for client in (flask_client, asgi_client):
+        assert client.post(f'/api/mask/batch?{query}', json=['김철수']).status_code == 400
+
+def test_resolve_settings_rejects_bad_values(model_manager):
+    pipeline = model_manager.pipeline
+    with pytest.raises(ValueError):
+        pipeline.resolve_settings(threshold='abc')
+    with pytest.raises(ValueError):
+        pipeline.resolve_settings(use_contextual_analysis='false')
+    assert pipeline.resolve_settings(threshold=40, use_contextual_analysis=False).use_contextual_analysis is False
+
+# ================== 증분 마스킹 ==================
+@pytest.mark.parametrize('middle', ['그는 일찍 끝났다.', '그는 정말 좋았다.'])
+def test_incremental_matches_full_text(model_manager, middle):
+    pipeline = model_manager.pipeline
+    doc = f'김철수씨가 서울대병원에 갔다. {middle} 박영희 교수가 왔다.'
+    full = pipeline.process(doc, verbose=False)
+    incremental, _ = pipeline.process_incremental(f'same-{middle}', doc)
+    assert incremental.masked_text == full.masked_text
+    assert incremental.total_entities == full.total_entities
+
+@pytest.mark.parametrize('doc_id', [['a'], {'a': 1}, None, 1.5, True])
+def test_incremental_rejects_bad_doc_id(flask_client, asgi_client, doc_id):
+    for client in (flask_client, asgi_client):
+        response = client.post('/api/mask/incremental', json={'doc_id': doc_id, 'text': '김철수씨가 입원했다'})
+        assert response.status_code == 400
+        assert 'fallback' not in _json(response)
+
+# ================== 처리 시간 집계 ==================
+def test_batch_wait_reaches_metrics():
+    from model_manager import ModelManager
+    manager = ModelManager(os.path.join(ROOT, 'no-such-model'), micro_batching=True)
+    result = manager.process_text('김철수씨가 서울대병원에 입원했다')
+    assert 'batch_wait' in result['stats']['stage_timings']
+    stages = manager.get_metrics()['stages']
+    assert stages['batch_wait']['count'] == 1
+    assert stages['total']['count'] == 1
@@ -1,8 +1,53 @@
 # server/api_routes.py
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
+import json
 import time
 import logging
 
+from masking_module import MASKING_MODES, MASKING_MODE_DESCRIPTIONS, THRESHOLD_MIN, THRESHOLD_MAX, settings_error
+
+def request_settings(data):
+    """요청 본문의 호출별 설정 (검사는 settings_error로)"""
+    return {
+        'threshold': data.get('threshold', 50),
+        'mode': data.get('mode', 'medical'),
+        'use_contextual_analysis': data.get('use_contextual_analysis', True)
+    }
+
+def query_settings(args, threshold: int):
+    """/api/mask/batch 쿼리 문자열의 호출별 설정 (threshold는 정수로 변환된 값)"""
+    flag = args.get('use_contextual_analysis', 'true')
+    return {
+        'threshold': threshold,
+        'mode': args.get('mode', 'medical'),
+        'use_contextual_analysis': {'true': True, 'false': False}.get(flag.lower(), flag)
+    }
+
+def delta_error(delta):
+    """/api/mask/incremental delta 형식 검사 (문제가 없으면 None, 문서 길이 검사는 파이프라인에서)"""
+    if not isinstance(delta, dict):
+        return 'delta는 {start, end, text} 객체여야 합니다'
+    if not all(type(delta.get(k)) is int for k in ('start', 'end')) or not isinstance(delta.get('text'), str):
+        return 'delta는 정수 start, end와 문자열 text가 필요합니다'
+    if not 0 <= delta['start'] <= delta['end']:
+        return f"잘못된 편집 범위: [{delta['start']}, {delta['end']})"
+    return None
+
+def incremental_error(data):
+    """/api/mask/incremental 요청 형식 검사 (문제가 없으면 None)"""
+    if 'doc_id' not in data:
+        return 'doc_id 필드가 필요합니다'
+    if not isinstance(data['doc_id'], (str, int)) or isinstance(data['doc_id'], bool):
+        return 'doc_id는 문자열 또는 정수여야 합니다'
+    if 'text' in data:
+        return None if isinstance(data['text'], str) else 'text는 문자열이어야 합니다'
+    if 'delta' not in data:
+        return 'text 또는 delta 필드가 필요합니다'
+    return delta_error(data['delta'])
+
+# /api/mask/batch: resume_after로 준 id가 입력에 없을 때의 오류
+RESUME_NOT_FOUND = "resume_after id '{}'를 입력에서 찾지 못했습니다"
+
 def create_api_routes(app):
     """API 라우트 생성"""
 
@@ -24,11 +69,10 @@ def create_api_routes(app):
                 return jsonify({'success': False, 'error': '텍스트가 비어있습니다'}), 400
 
             # 설정 파라미터
-            settings = {
-                'threshold': data.get('threshold', 50),
-                'mode': data.get('mode', 'medical'),
-                'use_contextual_analysis': data.get('use_contextual_analysis', True)
-            }
+            settings = request_settings(data)
+            error = settings_error(**settings)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
 
             # 처리 시간 측정
             start_time = time.time()
@@ -48,6 +92,7 @@ def create_api_routes(app):
                         'total_entities': result['total_entities'],
                         'masked_entities': result['masked_entities'],
                         'processing_time': round(processing_time, 3),
+                        'stage_timings': result['stats']['stage_timings'],
                         'avg_risk': result['stats']['avg_risk']
                     },
                     'masking_log': result['masking_log'],
@@ -78,6 +123,138 @@ def create_api_routes(app):
                 'fallback': True
             }), 500
 
+    @app.route('/api/mask/batch', methods=['POST'])
+    def mask_batch():
+        """대량 마스킹 API (결과를 NDJSON으로 스트리밍)
+
+        입력: JSON 배열 또는 NDJSON (Content-Type: application/x-ndjson). 각 문서는
+        {"id": ..., "text": ...} 또는 문자열이며, id가 없으면 0부터의 순번을 id로 쓴다.
+        출력: 문서마다 한 줄씩 결과를 보내고 마지막 줄에 {"done": true, "count": n}을 보낸다.
+        연결이 끊기면 같은 입력을 ?resume_after=<마지막으로 받은 id>로 다시 보내 이어서 받는다.
+        ?batch_size(기본 32)는 결과를 보내기 전에 모을 문서 수이며 서버 상한(BATCH_MAX_SIZE)을 넘지 않는다.
+        resume_after id가 입력에 없으면 마지막 줄은 {"done": false, "error": ...}이다.
+        """
+        if not app.model_manager.is_model_loaded():
+            return jsonify({'success': False, 'error': 'Model not loaded', 'fallback': True}), 500
+
+        resume_after = request.args.get('resume_after')
+        try:
+            batch_size = int(request.args.get('batch_size', 32))
+            threshold = int(request.args.get('threshold', 50))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'batch_size와 threshold는 정수여야 합니다'}), 400
+        if batch_size < 1:
+            return jsonify({'success': False, 'error': 'batch_size는 1 이상이어야 합니다'}), 400
+        settings = query_settings(request.args, threshold)
+        error = settings_error(**settings)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        is_ndjson = request.mimetype in ('application/x-ndjson', 'application/jsonl')
+
+        if not is_ndjson:
+            data = request.get_json(silent=True)
+            if not isinstance(data, list):
+                return jsonify({'success': False, 'error': 'JSON 배열 또는 NDJSON 형식이어야 합니다'}), 400
+
+        resume = {'skipping': resume_after is not None}
+
+        def read_documents():
+            # NDJSON은 요청 본문을 한 줄씩 읽어 전체를 메모리에 올리지 않음
+            lines = (json.loads(line) for line in request.stream if line.strip()) if is_ndjson else iter(data)
+            for index, doc in enumerate(lines):
+                doc_id, text = (doc.get('id', index), doc.get('text')) if isinstance(doc, dict) else (index, doc)
+                if resume['skipping']:
+                    resume['skipping'] = str(doc_id) != resume_after
+                    continue
+                yield doc_id, text
+
+        def generate():
+            count = 0
+            try:
+                for result in app.model_manager.process_documents(read_documents(), batch_size, settings):
+                    count += 1
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+            except Exception as e:
+                app.logger.error(f"❌ 배치 API 오류: {str(e)}")
+                yield json.dumps({'done': False, 'count': count, 'error': str(e)}, ensure_ascii=False) + '\n'
+                return
+            if resume['skipping']:
+                # 모든 문서를 건너뛴 경우 정상 완료와 구분되도록 오류로 끝냄
+                yield json.dumps({'done': False, 'count': count, 'error': RESUME_NOT_FOUND.format(resume_after)},
+                                 ensure_ascii=False) + '\n'
+                return
+            app.logger.info(f"✅ 배치 마스킹 완료: {count}건")
+            yield json.dumps({'done': True, 'count': count}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.route('/api/mask/incremental', methods=['POST'])
+    def mask_incremental():
+        """편집 중인 문서 증분 마스킹 API
+
+        처음에는 {doc_id, text}, 이후에는 {doc_id, base_version, delta: {start, end, text}}를 보낸다.
+        세션이 없거나 버전이 맞지 않으면 409와 resync=true를 돌려주며, 이때 전체 텍스트를 다시 보낸다.
+        """
+        try:
+            if not request.is_json:
+                return jsonify({'success': False, 'error': 'JSON 형식이 아닙니다'}), 400
+
+            data = request.get_json()
+
+            error = incremental_error(data)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+
+            settings = request_settings(data)
+            error = settings_error(**settings)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+
+            start_time = time.time()
+            result = app.model_manager.process_incremental(
+                data['doc_id'], data.get('text'), data.get('delta'), data.get('base_version'), settings)
+            processing_time = time.time() - start_time
+
+            if result['success']:
+                return jsonify({
+                    'success': True,
+                    'doc_id': result['doc_id'],
+                    'version': result['version'],
+                    'masked_text': result['masked_text'],
+                    'stats': {
+                        'total_entities': result['total_entities'],
+                        'masked_entities': result['masked_entities'],
+                        'processing_time': round(processing_time, 3),
+                        'stage_timings': result['stats']['stage_timings'],
+                        'avg_risk': result['stats']['avg_risk']
+                    },
+                    'masking_log': result['masking_log']
+                })
+
+            if result.get('resync'):
+                return jsonify({'success': False, 'error': result['error'], 'resync': True}), 409
+            if result.get('invalid'):
+                return jsonify({'success': False, 'error': result['error']}), 400
+
+            return jsonify({
+                'success': False,
+                'error': result['error'],
+                'fallback': result.get('fallback', False)
+            }), 500
+
+        except Exception as e:
+            app.logger.error(f"❌ API 오류: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'fallback': True
+            }), 500
+
+    @app.route('/api/mask/incremental/<doc_id>', methods=['DELETE'])
+    def close_incremental(doc_id):
+        """증분 마스킹 문서 세션 종료"""
+        return jsonify({'success': app.model_manager.close_document(doc_id)})
+
     @app.route('/api/models', methods=['GET'])
     def get_models():
         """모델 정보 조회"""
@@ -96,8 +273,9 @@ def create_api_routes(app):
             return jsonify({
                 'current_settings': app.model_manager.get_model_status(),
                 'available_settings': {
-                    'threshold': {'min': 10, 'max': 100, 'default': 50},
-                    'modes': ['medical', 'general', 'strict'],
+                    'threshold': {'min': THRESHOLD_MIN, 'max': THRESHOLD_MAX, 'default': 50},
+                    'modes': list(MASKING_MODES),
+                    'mode_descriptions': MASKING_MODE_DESCRIPTIONS,
                     'contextual_analysis': {'type': 'boolean', 'default': True}
                 }
             })
@@ -112,6 +290,21 @@ def create_api_routes(app):
                 'updated_settings': app.model_manager.get_model_status()
             })
 
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """단계별 처리 시간 분포 조회 (최근 요청 기준 p50/p95/p99, ms)"""
+        return jsonify(app.model_manager.get_metrics())
+
+    @app.route('/api/cache', methods=['GET', 'DELETE'])
+    def handle_cache():
+        """결과 캐시 통계 조회 / 비우기"""
+        if request.method == 'DELETE':
+            return jsonify({
+                'success': app.model_manager.clear_cache(),
+                'cache': app.model_manager.get_cache_stats()
+            })
+        return jsonify({'cache': app.model_manager.get_cache_stats()})
+
     @app.route('/api/test', methods=['POST'])
     def test_pipeline():
         """파이프라인 테스트용 API"""
@@ -12,7 +12,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from model_manager import ModelManager
 from api_routes import create_api_routes
 
-def create_app():
+def create_app(model_manager: ModelManager = None):
     app = Flask(__name__)
     CORS(app)  # 크롬 익스텐션에서 접근 허용
 
@@ -20,8 +20,8 @@ def create_app():
     logging.basicConfig(level=logging.INFO)
     app.logger.info('🚀 Privacy Guard LLM Server 시작')
 
-    # 모델 매니저 초기화
-    model_manager = ModelManager()
+    # 모델 매니저 초기화 (prefork 워커는 부모가 로드한 것을 넘겨받음)
+    model_manager = model_manager or ModelManager()
     app.model_manager = model_manager
 
     # API 라우트 등록
@@ -46,9 +46,13 @@ def create_app():
             'description': 'AI 기반 의료 텍스트 비식별화 서버',
             'endpoints': {
                 'mask': '/api/mask',
+                'mask_batch': '/api/mask/batch',
+                'mask_incremental': '/api/mask/incremental',
                 'health': '/health',
                 'models': '/api/models',
-                'settings': '/api/settings'
+                'settings': '/api/settings',
+                'cache': '/api/cache',
+                'metrics': '/api/metrics'
             },
             'model_status': app.model_manager.get_model_status()
         })
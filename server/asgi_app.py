@@ -0,0 +1,422 @@
+# server/asgi_app.py
+"""
+Privacy Guard LLM - ASGI 서버 모드 (Flask 앱과 같은 라우트)
+
+실행:
+    cd server && uvicorn asgi_app:create_asgi_app --factory --port 8000
+    cd server && python asgi_app.py   (PRIVACY_GUARD_HOST, PRIVACY_GUARD_ASGI_PORT)
+
+모델 호출은 크기가 정해진 워커 풀에서 실행하고, 풀과 대기열이 가득 차면
+429와 Retry-After로 거절한다. /health 등은 이벤트 루프에서 바로 응답한다.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from starlette.applications import Starlette
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+except ImportError as e:
+    raise ImportError("ASGI 모드에는 starlette와 uvicorn이 필요합니다: pip install starlette uvicorn") from e
+
+# 상위 디렉토리의 masking_module import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from model_manager import ModelManager
+from masking_module import MASKING_MODES, MASKING_MODE_DESCRIPTIONS, THRESHOLD_MIN, THRESHOLD_MAX, settings_error
+from api_routes import RESUME_NOT_FOUND, incremental_error, request_settings, query_settings
+
+class PoolFullError(Exception):
+    """모델 워커와 대기열이 모두 찬 상태"""
+
+class ModelWorkerPool:
+    """모델 호출용 스레드 풀 (실행 중 + 대기 중 요청 수 상한)
+
+    _pending은 이벤트 루프 스레드에서만 바뀌므로 별도 잠금이 필요 없다.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='model-worker')
+        self._pending = 0
+        self.completed = self.rejected = 0
+
+    def acquire(self):
+        """실행 슬롯 하나 확보 (실행 중 + 대기 중 수가 상한이면 PoolFullError)"""
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolFullError()
+        self._pending += 1
+
+    def release(self):
+        self._pending -= 1
+        self.completed += 1
+
+    async def run(self, fn, *args, acquired: bool = False, **kwargs):
+        """fn을 워커에서 실행 (acquired=True이면 호출자가 이미 확보한 슬롯으로 실행)"""
+        if not acquired:
+            self.acquire()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            if not acquired:
+                self.release()
+
+    def stats(self):
+        return {'max_workers': self.max_workers, 'max_queue': self.max_queue, 'pending': self._pending,
+                'completed': self.completed, 'rejected': self.rejected}
+
+class RequestStreamingResponse(StreamingResponse):
+    """요청 본문을 읽으면서 응답을 보내는 스트리밍 응답
+
+    StreamingResponse의 연결 끊김 감지 태스크는 receive()를 함께 호출해 본문 메시지를
+    가로채므로 쓰지 않는다. 연결이 끊기면 본문 읽기나 전송에서 예외로 끝난다.
+    """
+
+    def __init__(self, content, release=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            # 스트림이 끝나거나 끊기면 수락할 때 확보한 슬롯을 반환
+            if self.release is not None:
+                self.release()
+        if self.background is not None:
+            await self.background()
+
+def _error(error: str, status: int, **extra) -> JSONResponse:
+    # extra에 message(사용자 안내)가 올 수 있으므로 첫 인자는 error
+    return JSONResponse({'success': False, 'error': error, **extra}, status_code=status)
+
+def _too_busy() -> JSONResponse:
+    return JSONResponse({'success': False, 'error': '서버가 처리 가능한 요청 수를 초과했습니다', 'retry': True},
+                        status_code=429, headers={'Retry-After': str(config.ASGI_RETRY_AFTER)})
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def create_asgi_app(model_manager: ModelManager = None, max_workers: int = None, max_queue: int = None) -> Starlette:
+    logging.basicConfig(level=logging.INFO)
+    logging.info('🚀 Privacy Guard LLM ASGI Server 시작')
+
+    model_manager = model_manager or ModelManager()
+    pool = ModelWorkerPool(max_workers or config.ASGI_MODEL_WORKERS, max_queue or config.ASGI_MAX_QUEUE)
+
+    async def server_info(request):
+        return JSONResponse({
+            'name': 'Privacy Guard LLM API Server',
+            'version': '1.0.0',
+            'description': 'AI 기반 의료 텍스트 비식별화 서버 (ASGI)',
+            'endpoints': {
+                'mask': '/api/mask',
+                'mask_batch': '/api/mask/batch',
+                'mask_incremental': '/api/mask/incremental',
+                'health': '/health',
+                'models': '/api/models',
+                'settings': '/api/settings',
+                'cache': '/api/cache',
+                'metrics': '/api/metrics'
+            },
+            'model_status': model_manager.get_model_status()
+        })
+
+    async def health_check(request):
+        # 모델 워커를 거치지 않으므로 추론이 밀려 있어도 바로 응답
+        return JSONResponse({
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'model_loaded': model_manager.is_model_loaded(),
+            'workers': pool.stats(),
+            'version': '1.0.0'
+        })
+
+    async def mask_text(request):
+        data = await _json_body(request)
+        if data is None:
+            return _error('JSON 형식이 아닙니다', 400)
+        if 'text' not in data:
+            return _error('text 필드가 필요합니다', 400)
+        text = data['text']
+        if not isinstance(text, str):
+            return _error('text는 문자열이어야 합니다', 400)
+        if not text or len(text.strip()) == 0:
+            return _error('텍스트가 비어있습니다', 400)
+        settings = request_settings(data)
+        error = settings_error(**settings)
+        if error:
+            return _error(error, 400)
+
+        start_time = time.time()
+        try:
+            result = await pool.run(model_manager.process_text, text, settings)
+        except PoolFullError:
+            return _too_busy()
+        processing_time = time.time() - start_time
+
+        if not result['success']:
+            return _error(result['error'], 500, fallback=result.get('fallback', False),
+                          message='서버 모델 사용 불가 - JavaScript 버전으로 fallback 권장')
+        return JSONResponse({
+            'success': True,
+            'masked_text': result['masked_text'],
+            'original_text': result['original_text'],
+            'stats': {
+                'total_entities': result['total_entities'],
+                'masked_entities': result['masked_entities'],
+                'processing_time': round(processing_time, 3),
+                'stage_timings': result['stats']['stage_timings'],
+                'avg_risk': result['stats']['avg_risk']
+            },
+            'masking_log': result['masking_log'],
+            'model_info': {
+                'name': 'KoELECTRA + LoRA',
+                'pipeline_stages': 4,
+                'threshold': settings['threshold']
+            }
+        })
+
+    async def mask_batch(request):
+        """대량 마스킹 (Flask /api/mask/batch와 같은 입출력, NDJSON 입력도 한 줄씩 읽음)"""
+        if not model_manager.is_model_loaded():
+            return _error('Model not loaded', 500, fallback=True)
+        params = request.query_params
+        resume_after = params.get('resume_after')
+        try:
+            batch_size = int(params.get('batch_size', 32))
+            threshold = int(params.get('threshold', 50))
+        except ValueError:
+            return _error('batch_size와 threshold는 정수여야 합니다', 400)
+        if batch_size < 1:
+            return _error('batch_size는 1 이상이어야 합니다', 400)
+        # 스트림에서 모을 문서 수도 process_documents와 같은 서버 상한으로 제한
+        batch_size = min(batch_size, config.BATCH_MAX_SIZE)
+        settings = query_settings(params, threshold)
+        error = settings_error(**settings)
+        if error:
+            return _error(error, 400)
+        is_ndjson = request.headers.get('content-type', '').split(';')[0] in ('application/x-ndjson', 'application/jsonl')
+
+        if is_ndjson:
+            async def read_lines():
+                buffer = b''
+                async for chunk in request.stream():
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        if line.strip():
+                            yield json.loads(line)
+                if buffer.strip():
+                    yield json.loads(buffer)
+            docs = read_lines()
+        else:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            if not isinstance(data, list):
+                return _error('JSON 배열 또는 NDJSON 형식이어야 합니다', 400)
+
+            async def iterate():
+                for doc in data:
+                    yield doc
+            docs = iterate()
+
+        resume = {'skipping': resume_after is not None}
+
+        async def read_batches():
+            batch, index = [], 0
+            async for doc in docs:
+                doc_id, text = (doc.get('id', index), doc.get('text')) if isinstance(doc, dict) else (index, doc)
+                index += 1
+                if resume['skipping']:
+                    resume['skipping'] = str(doc_id) != resume_after
+                    continue
+                batch.append((doc_id, text))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        async def generate():
+            count = 0
+            try:
+                async for batch in read_batches():
+                    # 스트림을 수락할 때 확보한 슬롯 하나로 배치를 차례로 처리
+                    results = await pool.run(lambda b=batch: list(model_manager.process_documents(b, batch_size, settings)),
+                                             acquired=True)
+                    for result in results:
+                        count += 1
+                        yield json.dumps(result, ensure_ascii=False) + '\n'
+            except Exception as e:
+                logging.error(f"❌ 배치 API 오류: {str(e)}")
+                yield json.dumps({'done': False, 'count': count, 'error': str(e)}, ensure_ascii=False) + '\n'
+                return
+            if resume['skipping']:
+                yield json.dumps({'done': False, 'count': count, 'error': RESUME_NOT_FOUND.format(resume_after)},
+                                 ensure_ascii=False) + '\n'
+                return
+            yield json.dumps({'done': True, 'count': count}) + '\n'
+
+        try:
+            pool.acquire()
+        except PoolFullError:
+            return _too_busy()
+        return RequestStreamingResponse(generate(), release=pool.release, media_type='application/x-ndjson')
+
+    async def mask_incremental(request):
+        data = await _json_body(request)
+        if data is None:
+            return _error('JSON 형식이 아닙니다', 400)
+        error = incremental_error(data)
+        if error:
+            return _error(error, 400)
+        settings = request_settings(data)
+        error = settings_error(**settings)
+        if error:
+            return _error(error, 400)
+
+        start_time = time.time()
+        try:
+            result = await pool.run(model_manager.process_incremental, data['doc_id'], data.get('text'),
+                                    data.get('delta'), data.get('base_version'), settings)
+        except PoolFullError:
+            return _too_busy()
+        processing_time = time.time() - start_time
+
+        if result['success']:
+            return JSONResponse({
+                'success': True,
+                'doc_id': result['doc_id'],
+                'version': result['version'],
+                'masked_text': result['masked_text'],
+                'stats': {
+                    'total_entities': result['total_entities'],
+                    'masked_entities': result['masked_entities'],
+                    'processing_time': round(processing_time, 3),
+                    'stage_timings': result['stats']['stage_timings'],
+                    'avg_risk': result['stats']['avg_risk']
+                },
+                'masking_log': result['masking_log']
+            })
+        if result.get('resync'):
+            return _error(result['error'], 409, resync=True)
+        if result.get('invalid'):
+            return _error(result['error'], 400)
+        return _error(result['error'], 500, fallback=result.get('fallback', False))
+
+    async def close_incremental(request):
+        return JSONResponse({'success': model_manager.close_document(request.path_params['doc_id'])})
+
+    async def get_models(request):
+        model_status = model_manager.get_model_status()
+        return JSONResponse({
+            'models': [model_status],
+            'current_model': model_status['name'] if model_status['loaded'] else None,
+            'total_models': 1
+        })
+
+    async def handle_settings(request):
+        if request.method == 'GET':
+            return JSONResponse({
+                'current_settings': model_manager.get_model_status(),
+                'available_settings': {
+                    'threshold': {'min': THRESHOLD_MIN, 'max': THRESHOLD_MAX, 'default': 50},
+                    'modes': list(MASKING_MODES),
+                    'mode_descriptions': MASKING_MODE_DESCRIPTIONS,
+                    'contextual_analysis': {'type': 'boolean', 'default': True}
+                }
+            })
+        data = await _json_body(request) or {}
+        return JSONResponse({
+            'success': model_manager.update_settings(data),
+            'updated_settings': model_manager.get_model_status()
+        })
+
+    async def get_metrics(request):
+        metrics = model_manager.get_metrics()
+        metrics['workers'] = pool.stats()
+        return JSONResponse(metrics)
+
+    async def handle_cache(request):
+        if request.method == 'DELETE':
+            return JSONResponse({'success': model_manager.clear_cache(), 'cache': model_manager.get_cache_stats()})
+        return JSONResponse({'cache': model_manager.get_cache_stats()})
+
+    async def test_pipeline(request):
+        test_cases = [
+            "김철수씨가 2023년 10월에 서울대병원에서 간암 진단을 받았습니다.",
+            "박영희(010-1234-5678)는 삼성서울병원에서 수술을 받았다.",
+            "환자는 내일 검사를 받을 예정입니다."
+        ]
+        results = []
+        for text in test_cases:
+            try:
+                result = await pool.run(model_manager.process_text, text)
+            except PoolFullError:
+                return _too_busy()
+            results.append({
+                'input': text,
+                'output': result.get('masked_text', '처리 실패'),
+                'success': result['success']
+            })
+        return JSONResponse({'test_results': results, 'model_status': model_manager.get_model_status()})
+
+    routes = [
+        Route('/', server_info, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/api/mask', mask_text, methods=['POST']),
+        Route('/api/mask/batch', mask_batch, methods=['POST']),
+        Route('/api/mask/incremental', mask_incremental, methods=['POST']),
+        Route('/api/mask/incremental/{doc_id}', close_incremental, methods=['DELETE']),
+        Route('/api/models', get_models, methods=['GET']),
+        Route('/api/settings', handle_settings, methods=['GET', 'POST']),
+        Route('/api/metrics', get_metrics, methods=['GET']),
+        Route('/api/cache', handle_cache, methods=['GET', 'DELETE']),
+        Route('/api/test', test_pipeline, methods=['POST']),
+    ]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        pool.executor.shutdown(wait=False)
+
+    # 크롬 익스텐션에서 접근 허용
+    app = Starlette(routes=routes, middleware=[Middleware(CORSMiddleware, allow_origins=['*'],
+                                                          allow_methods=['*'], allow_headers=['*'])],
+                    lifespan=lifespan)
+    app.state.model_manager = model_manager
+    app.state.pool = pool
+    return app
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 60)
+    print("🏥🔒 Privacy Guard LLM Server (ASGI)")
+    print("=" * 60)
+    print(f"📡 서버 주소: http://{config.SERVER_HOST}:{config.ASGI_PORT}")
+    print(f"🧵 모델 워커 {config.ASGI_MODEL_WORKERS}개, 대기열 {config.ASGI_MAX_QUEUE}개")
+    print("=" * 60)
+
+    uvicorn.run(create_asgi_app(), host=config.SERVER_HOST, port=config.ASGI_PORT)
@@ -0,0 +1,74 @@
+# server/batcher.py
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Any, Dict, Hashable
+
+class MicroBatcher:
+    """동시에 들어온 요청을 모아 한 번의 배치 처리로 실행하는 스케줄러
+
+    워커 스레드가 첫 요청을 받은 뒤 max_wait_ms 동안 또는 max_batch_size개가 찰 때까지
+    요청을 모아 process_batch(texts, key)를 호출하고, 결과를 각 요청에 돌려준다.
+    key(요청별 설정 등)가 다른 요청은 같은 배치 안에서도 key별로 나눠 처리한다.
+    """
+
+    def __init__(self, process_batch: Callable[[List[str], Hashable], List[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = self.items = 0
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str, key: Hashable = None) -> Future:
+        future = Future()
+        self._queue.put((text, key, future))
+        return future
+
+    def process(self, text: str, key: Hashable = None, timeout: float = None) -> Any:
+        """요청 하나를 제출하고 배치 처리 결과를 기다림"""
+        return self.submit(text, key).result(timeout)
+
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for text, key, future in batch:
+                groups.setdefault(key, []).append((text, future))
+            for key, items in groups.items():
+                try:
+                    results = self.process_batch([text for text, _ in items], key)
+                except Exception as e:
+                    logging.error(f"배치 처리 오류: {e}")
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'max_batch_size': self.max_batch_size, 'max_wait_ms': self.max_wait_ms,
+                    'batches': self.batches, 'items': self.items, 'queued': self._queue.qsize(),
+                    'avg_batch_size': self.items / self.batches if self.batches else 0.0}
@@ -0,0 +1,33 @@
+# server/config.py
+import os
+
+# 워커 간 공유 결과 캐시 (SQLite 파일 경로, 비어 있으면 사용 안 함)
+SHARED_CACHE_PATH = os.environ.get('PRIVACY_GUARD_SHARED_CACHE', '')
+SHARED_CACHE_MAXSIZE = int(os.environ.get('PRIVACY_GUARD_SHARED_CACHE_MAXSIZE', 100_000))
+SHARED_CACHE_TTL = float(os.environ.get('PRIVACY_GUARD_SHARED_CACHE_TTL', 3600))
+
+# /api/mask 마이크로 배칭 (동시 요청을 모아 한 번의 배치 NER로 처리)
+MICRO_BATCH_ENABLED = os.environ.get('PRIVACY_GUARD_MICRO_BATCH', '1') != '0'
+MICRO_BATCH_MAX_SIZE = int(os.environ.get('PRIVACY_GUARD_MICRO_BATCH_MAX_SIZE', 16))
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get('PRIVACY_GUARD_MICRO_BATCH_MAX_WAIT_MS', 5))
+
+# /api/mask/batch: ?batch_size(응답 전에 모을 문서 수) 상한과 NER forward pass 배치 크기
+BATCH_MAX_SIZE = int(os.environ.get('PRIVACY_GUARD_BATCH_MAX_SIZE', 256))
+NER_BATCH_SIZE = int(os.environ.get('PRIVACY_GUARD_NER_BATCH_SIZE', 32))
+
+# ASGI 서버 모드 (asgi_app.py): 모델 워커 수와 대기열 상한, 초과 시 429 Retry-After(초)
+# 마이크로 배칭을 쓰면 워커는 배치 결과를 기다리기만 하므로 배치 두 개를 채울 만큼 둔다
+# 기본은 localhost에서만 접근 가능 (외부 공개는 PRIVACY_GUARD_HOST=0.0.0.0 등으로 명시)
+SERVER_HOST = os.environ.get('PRIVACY_GUARD_HOST', 'localhost')
+ASGI_PORT = int(os.environ.get('PRIVACY_GUARD_ASGI_PORT', 8000))
+ASGI_MODEL_WORKERS = int(os.environ.get(
+    'PRIVACY_GUARD_ASGI_MODEL_WORKERS', 2 * MICRO_BATCH_MAX_SIZE if MICRO_BATCH_ENABLED else os.cpu_count() or 1))
+ASGI_MAX_QUEUE = int(os.environ.get('PRIVACY_GUARD_ASGI_MAX_QUEUE', 64))
+ASGI_RETRY_AFTER = int(os.environ.get('PRIVACY_GUARD_ASGI_RETRY_AFTER', 1))
+
+# prefork 멀티프로세스 서버 (prefork.py): 워커 수, 워커당 torch 스레드 수 (0이면 코어 수 / 워커 수)
+PREFORK_WORKERS = int(os.environ.get('PRIVACY_GUARD_PREFORK_WORKERS', os.cpu_count() or 1))
+PREFORK_THREADS_PER_WORKER = int(os.environ.get('PRIVACY_GUARD_PREFORK_THREADS_PER_WORKER', 0))
+# 시작 후 이 시간(초) 안에 죽은 워커는 재시작을 지수적으로 늦추고, 연속 횟수가 한도를 넘으면 서버 종료
+PREFORK_MIN_UPTIME = float(os.environ.get('PRIVACY_GUARD_PREFORK_MIN_UPTIME', 10))
+PREFORK_MAX_FAST_RESTARTS = int(os.environ.get('PRIVACY_GUARD_PREFORK_MAX_FAST_RESTARTS', 5))
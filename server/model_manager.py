@@ -1,24 +1,41 @@
 # server/model_manager.py
 import os
 import sys
+import time
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
 
 # 상위 디렉토리의 masking_module import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from masking_module import CompleteMedicalDeidentificationPipeline
+    from masking_module import CompleteMedicalDeidentificationPipeline, StaleDocumentError, InvalidEditError
 except ImportError as e:
     logging.error(f"masking_module import 실패: {e}")
     CompleteMedicalDeidentificationPipeline = None
+    StaleDocumentError = KeyError
+    InvalidEditError = ValueError
+
+import config
+from result_cache import SharedResultCache
+from batcher import MicroBatcher
 
 class ModelManager:
     """모델 로딩 및 관리 클래스"""
 
-    def __init__(self):
+    def __init__(self, model_path: str = None, shared_cache_path: str = None, micro_batching: bool = None):
         # 로컬 모델 경로 설정 (상대 경로)
-        self.model_path = "../ner-koelectra-lora-merged"
+        self.model_path = model_path or "../ner-koelectra-lora-merged"
+
+        # 워커 간 공유 캐시 (설정된 경우에만)
+        shared_cache_path = shared_cache_path or config.SHARED_CACHE_PATH
+        self.shared_cache = SharedResultCache(
+            shared_cache_path, config.SHARED_CACHE_MAXSIZE, config.SHARED_CACHE_TTL) if shared_cache_path else None
+
+        # 동시 요청을 모아 배치 처리 (모델을 다시 로드해도 현재 파이프라인을 사용)
+        if micro_batching is None:
+            micro_batching = config.MICRO_BATCH_ENABLED
+        self.batcher = self._make_batcher() if micro_batching else None
 
         self.pipeline = None
         self.model_info = {
@@ -31,6 +48,34 @@ class ModelManager:
         # 모델 자동 로드 시도
         self.load_model()
 
+    def _make_batcher(self) -> MicroBatcher:
+        # 요청별 설정(ProcessSettings)이 같은 요청끼리 묶여 처리됨
+        return MicroBatcher(
+            lambda texts, s: self.pipeline.process_batch(
+                texts, threshold=s.threshold, mode=s.mode, use_contextual_analysis=s.use_contextual_analysis),
+            config.MICRO_BATCH_MAX_SIZE, config.MICRO_BATCH_MAX_WAIT_MS)
+
+    def prepare_fork(self):
+        """fork 전 부모 프로세스에서 지연 초기화되는 객체를 미리 만들어 워커들이 공유하게 함"""
+        if not self.is_model_loaded():
+            return
+        self.pipeline.copula_analyzer.gazetteer
+        self.pipeline.process("김철수씨가 2023년 10월에 서울대병원에서 간암 진단을 받았습니다.", verbose=False)
+        # 워밍업 결과가 워커 통계/캐시에 섞이지 않도록 비움
+        if self.pipeline.result_cache is not None:
+            self.pipeline.result_cache.clear()
+        if self.pipeline.ner_model.sentence_cache:
+            self.pipeline.ner_model.sentence_cache.clear()
+        self.pipeline.metrics.reset()
+
+    def after_fork(self, micro_batching: bool = None):
+        """fork된 워커에서 호출: 스레드와 DB 연결은 fork로 넘어오지 않으므로 새로 만듦"""
+        if micro_batching is None:
+            micro_batching = config.MICRO_BATCH_ENABLED
+        self.batcher = self._make_batcher() if micro_batching else None
+        if self.shared_cache:
+            self.shared_cache.after_fork()
+
     def load_model(self, model_path: str = None, threshold: int = 50) -> bool:
         """모델 로드"""
         try:
@@ -103,44 +148,174 @@ class ModelManager:
             }
 
         try:
-            # 설정 업데이트 (임계값 등)
-            if settings:
-                if 'threshold' in settings:
-                    self.pipeline.masking_executor.threshold = settings['threshold']
+            # 요청별 설정 (파이프라인 공유 상태는 바꾸지 않음)
+            process_settings = self._process_settings(settings)
+
+            # 다른 워커가 이미 처리한 입력이면 공유 캐시에서 복원
+            shared_key = None
+            if self.shared_cache:
+                start = time.perf_counter()
+                shared_key = SharedResultCache.make_key(
+                    text, process_settings.threshold, process_settings.mode,
+                    process_settings.use_contextual_analysis, self.pipeline.model_version)
+                payload = self.shared_cache.get(shared_key)
+                if payload is not None:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    timings = {'shared_cache': elapsed, 'total': elapsed}
+                    self.pipeline.metrics.record(timings, {'requests': 1, 'shared_cache_hits': 1})
+                    return self._build_response(text, payload, timings)
 
             # 실제 처리
-            result = self.pipeline.process(text, verbose=False)
+            if self.batcher:
+                start = time.perf_counter()
+                result = self.batcher.process(text, process_settings)
+                # 배치가 모이기를 기다린 시간 (파이프라인 total에는 포함되지 않음)
+                waited = max((time.perf_counter() - start) * 1000 - result.stage_timings['total'], 0.0)
+                result.stage_timings['batch_wait'] = waited
+                # 파이프라인은 이미 집계를 마쳤으므로 대기 시간은 따로 /api/metrics 분포에 반영
+                self.pipeline.metrics.record({'batch_wait': waited}, {})
+            else:
+                result = self.pipeline.process(text, verbose=False, **vars(process_settings))
+            payload = self._result_payload(result)
+            if shared_key:
+                self.shared_cache.put(shared_key, payload)
+
+            return self._build_response(text, payload, result.stage_timings)
 
+        except Exception as e:
+            logging.error(f"텍스트 처리 오류: {e}")
             return {
-                'success': True,
-                'masked_text': result.masked_text,
-                'original_text': result.original_text,
-                'total_entities': result.total_entities,
-                'masked_entities': result.masked_entities,
-                'masking_log': [
-                    {
-                        'token': log['token'],
-                        'entity': log.get('entity', 'UNKNOWN'),
-                        'risk_weight': log.get('risk_weight', 0),
-                        'masked_as': log.get('masked_as', '[MASKED]'),
-                        'reason': log.get('reason', '')
-                    }
-                    for log in result.masking_log
-                ],
-                'stats': {
-                    'processing_time': 0.1,  # 실제 측정하려면 time 모듈 사용
-                    'avg_risk': sum(log.get('risk_weight', 0) for log in result.masking_log) / len(result.masking_log) if result.masking_log else 0
-                }
+                'success': False,
+                'error': str(e),
+                'fallback': True
             }
 
+    def process_incremental(self, doc_id: str, text: str = None, delta: Dict[str, Any] = None,
+                            base_version: int = None, settings: Dict[str, Any] = None) -> Dict[str, Any]:
+        """편집 중인 문서 증분 처리 (바뀐 문장만 NER 재실행)"""
+        if not self.is_model_loaded():
+            return {
+                'success': False,
+                'error': 'Model not loaded',
+                'fallback': True
+            }
+
+        try:
+            process_settings = self._process_settings(settings)
+            result, version = self.pipeline.process_incremental(
+                doc_id, text, delta, base_version, **vars(process_settings))
+            response = self._build_response(result.original_text, self._result_payload(result), result.stage_timings)
+            response.update({'doc_id': doc_id, 'version': version})
+            return response
+
+        except StaleDocumentError as e:
+            # 클라이언트가 전체 텍스트를 다시 보내야 함
+            return {
+                'success': False,
+                'error': str(e),
+                'resync': True
+            }
+        except InvalidEditError as e:
+            # 잘못된 요청이므로 서버 모델 fallback을 권하지 않음
+            return {
+                'success': False,
+                'error': str(e),
+                'invalid': True
+            }
         except Exception as e:
-            logging.error(f"텍스트 처리 오류: {e}")
+            logging.error(f"증분 처리 오류: {e}")
             return {
                 'success': False,
                 'error': str(e),
                 'fallback': True
             }
 
+    def process_documents(self, documents: Iterable[Tuple[Any, Any]], batch_size: int = 32,
+                          settings: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """(문서 id, 텍스트) 스트림을 batch_size개씩 배치 처리하며 문서별 결과를 순서대로 생성
+
+        batch_size는 BATCH_MAX_SIZE로 제한하고, NER은 NER_BATCH_SIZE 단위로 추론한다.
+        """
+        process_settings = self._process_settings(settings)
+        batch_size = min(batch_size, config.BATCH_MAX_SIZE)
+
+        batch = []
+        for doc_id, text in documents:
+            if not isinstance(text, str) or not text.strip():
+                # 앞선 문서들의 순서를 지키기 위해 모아둔 배치를 먼저 처리
+                yield from self._process_document_batch(batch, process_settings)
+                batch = []
+                yield {'id': doc_id, 'success': False, 'error': '텍스트가 비어있습니다'}
+                continue
+            batch.append((doc_id, text))
+            if len(batch) >= batch_size:
+                yield from self._process_document_batch(batch, process_settings)
+                batch = []
+        yield from self._process_document_batch(batch, process_settings)
+
+    def _process_document_batch(self, batch, process_settings) -> Iterator[Dict[str, Any]]:
+        if not batch:
+            return
+        try:
+            results = self.pipeline.process_batch([text for _, text in batch], batch_size=config.NER_BATCH_SIZE,
+                                                  **vars(process_settings))
+        except Exception as e:
+            logging.error(f"배치 처리 오류: {e}")
+            for doc_id, _ in batch:
+                yield {'id': doc_id, 'success': False, 'error': str(e)}
+            return
+        for (doc_id, text), result in zip(batch, results):
+            response = self._build_response(text, self._result_payload(result), result.stage_timings)
+            del response['original_text']
+            yield {'id': doc_id, **response}
+
+    def _process_settings(self, settings: Dict[str, Any] = None):
+        """요청 설정 dict를 파이프라인 ProcessSettings로 변환 (없는 항목은 기본값)"""
+        settings = settings or {}
+        return self.pipeline.resolve_settings(
+            settings.get('threshold'), settings.get('mode'), settings.get('use_contextual_analysis'))
+
+    @staticmethod
+    def _result_payload(result) -> Dict[str, Any]:
+        """MaskingResult에서 캐시 가능한 부분만 추출 (원문 토큰은 빼고 위치만 보관)"""
+        return {
+            'masked_text': result.masked_text,
+            'total_entities': result.total_entities,
+            'masked_entities': result.masked_entities,
+            'masking_log': [
+                {
+                    'entity': log.get('entity', 'UNKNOWN'),
+                    'risk_weight': log.get('risk_weight', 0),
+                    'masked_as': log.get('masked_as', '[MASKED]'),
+                    'start': log['start'],
+                    'end': log['end'],
+                    'reason': log.get('reason', '')
+                }
+                for log in result.masking_log
+            ]
+        }
+
+    def close_document(self, doc_id: str) -> bool:
+        """증분 처리 문서 세션 종료"""
+        return self.is_model_loaded() and self.pipeline.close_document(doc_id)
+
+    def _build_response(self, text: str, payload: Dict[str, Any], stage_timings: Dict[str, float]) -> Dict[str, Any]:
+        """캐시 가능한 처리 결과에 원문, 토큰, 단계별 소요 시간(ms)을 붙여 응답 생성"""
+        masking_log = [{'token': text[log['start']:log['end']], **log} for log in payload['masking_log']]
+        return {
+            'success': True,
+            'masked_text': payload['masked_text'],
+            'original_text': text,
+            'total_entities': payload['total_entities'],
+            'masked_entities': payload['masked_entities'],
+            'masking_log': masking_log,
+            'stats': {
+                'processing_time': stage_timings.get('total', 0.0) / 1000,
+                'stage_timings': {stage: round(ms, 3) for stage, ms in stage_timings.items()},
+                'avg_risk': sum(log['risk_weight'] for log in masking_log) / len(masking_log) if masking_log else 0
+            }
+        }
+
     def is_model_loaded(self) -> bool:
         """모델 로드 상태 확인"""
         return self.pipeline is not None and self.model_info['loaded']
@@ -149,10 +324,41 @@ class ModelManager:
         """모델 상태 정보 반환"""
         return self.model_info.copy()
 
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """결과 캐시 적중/미스 통계 반환 (프로세스 내부 캐시 + 워커 간 공유 캐시)"""
+        stats = {'enabled': False}
+        if self.is_model_loaded() and self.pipeline.result_cache is not None:
+            stats = {'enabled': True, **self.pipeline.result_cache.stats()}
+        stats['shared'] = {'enabled': True, **self.shared_cache.stats()} if self.shared_cache else {'enabled': False}
+        sentence_cache = self.pipeline.ner_model.sentence_cache if self.is_model_loaded() else None
+        stats['ner_sentences'] = {'enabled': True, **sentence_cache.stats()} if sentence_cache else {'enabled': False}
+        return stats
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """단계별 소요 시간 분포(p50/p95/p99)와 누적 카운터 반환"""
+        if not self.is_model_loaded():
+            return {'stages': {}, 'counters': {}}
+        metrics = self.pipeline.metrics.summary()
+        metrics['batcher'] = {'enabled': True, **self.batcher.stats()} if self.batcher else {'enabled': False}
+        return metrics
+
+    def clear_cache(self) -> bool:
+        """결과 캐시 비우기"""
+        if self.shared_cache:
+            self.shared_cache.clear()
+        if not self.is_model_loaded() or self.pipeline.result_cache is None:
+            return self.shared_cache is not None
+        self.pipeline.result_cache.clear()
+        if self.pipeline.ner_model.sentence_cache:
+            self.pipeline.ner_model.sentence_cache.clear()
+        return True
+
     def update_settings(self, settings: Dict[str, Any]) -> bool:
-        """설정 업데이트"""
+        """기본 설정 업데이트 (요청별 설정은 process_text의 settings로 전달)"""
         try:
             if self.pipeline and 'threshold' in settings:
+                # 요청별 threshold와 같은 검사 (잘못된 값이면 ValueError)
+                self.pipeline.resolve_settings(threshold=settings['threshold'])
                 self.pipeline.masking_executor.threshold = settings['threshold']
                 self.model_info['threshold'] = settings['threshold']
 
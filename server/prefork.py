@@ -0,0 +1,198 @@
+# server/prefork.py
+"""
+Privacy Guard LLM - prefork 멀티프로세스 서버
+
+부모 프로세스가 모델과 copula 테이블을 한 번 로드한 뒤 워커 N개를 fork한다.
+워커들은 가중치를 copy-on-write로 공유하고 같은 리슨 소켓에서 요청을 나눠 받는다.
+
+실행:
+    cd server && python prefork.py --workers 8 --port 8000
+    cd server && python prefork.py --workers 8 --threads-per-worker 4 --server asgi
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+from typing import Dict, List
+
+import torch
+
+# 상위 디렉토리의 masking_module import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from model_manager import ModelManager
+
+def default_threads_per_worker(workers: int) -> int:
+    """워커들이 코어를 나눠 쓰도록 워커당 torch intra-op 스레드 수 결정"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def worker_memory(pid: int) -> Dict[str, int]:
+    """프로세스 메모리 (kB): rss, pss(공유 페이지를 나눠 계산), uss(해당 프로세스 전용)"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': fields.get('Rss', 0), 'pss': fields.get('Pss', 0),
+            'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+class PreforkServer:
+    """모델을 로드한 부모에서 워커 프로세스를 fork하고 감시하는 서버
+
+    fork 시점에 부모는 스레드가 없어야 하므로 model_manager는 micro_batching=False로 만들고,
+    마이크로 배처 등은 워커에서 after_fork()로 새로 시작한다.
+    """
+
+    def __init__(self, model_manager: ModelManager, sock: socket.socket, workers: int,
+                 threads_per_worker: int = None, server_type: str = 'flask'):
+        self.model_manager = model_manager
+        self.sock = sock
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        self.server_type = server_type
+        self.pids: List[int] = []
+        self._started_at: Dict[int, float] = {}
+        self._fast_failures = 0
+        self._stopping = False
+
+    def start(self):
+        self.model_manager.prepare_fork()
+        # 로드된 객체를 GC 추적 대상에서 빼서 워커의 GC가 공유 페이지에 쓰지 않게 함
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        logging.info(f"🍴 워커 {self.workers}개 시작 (워커당 torch 스레드 {self.threads_per_worker}개)")
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self._run_worker()
+                status = 0
+            except BaseException:
+                logging.exception("❌ 워커 오류")
+            finally:
+                os._exit(status)
+        self.pids.append(pid)
+        self._started_at[pid] = time.monotonic()
+
+    def _run_worker(self):
+        # 종료는 부모가 SIGTERM으로 지시
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        torch.set_num_threads(self.threads_per_worker)
+        self.model_manager.after_fork()
+
+        if self.server_type == 'asgi':
+            import uvicorn
+            from asgi_app import create_asgi_app
+            server = uvicorn.Server(uvicorn.Config(create_asgi_app(self.model_manager), log_level='warning'))
+            server.run(sockets=[self.sock])
+            return
+
+        from werkzeug.serving import make_server
+        from app import create_app
+        host, port = self.sock.getsockname()[:2]
+        make_server(host, port, create_app(self.model_manager), threaded=True, fd=self.sock.fileno()).serve_forever()
+
+    def supervise(self) -> bool:
+        """워커가 비정상 종료하면 다시 fork (stop()이 호출될 때까지 대기)
+
+        시작 직후 죽는 워커가 이어지면 재시작 간격을 1, 2, 4...초로 늘리고, 연속
+        PREFORK_MAX_FAST_RESTARTS번을 넘으면 모든 워커를 멈추고 False를 반환한다.
+        """
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            if pid not in self.pids:
+                continue
+            self.pids.remove(pid)
+            uptime = time.monotonic() - self._started_at.pop(pid)
+            if self._stopping:
+                continue
+            if uptime >= config.PREFORK_MIN_UPTIME:
+                self._fast_failures = 0
+                logging.warning(f"⚠️ 워커 {pid} 종료 (status {status}), 다시 시작합니다")
+                self._spawn()
+                continue
+            self._fast_failures += 1
+            if self._fast_failures > config.PREFORK_MAX_FAST_RESTARTS:
+                logging.error(f"❌ 워커가 시작 직후 {self._fast_failures}번 연속 종료되어 서버를 멈춥니다")
+                self.stop()
+                return False
+            delay = min(2 ** (self._fast_failures - 1), 60)
+            logging.warning(f"⚠️ 워커 {pid}가 시작 {uptime:.1f}초 만에 종료 (status {status}), {delay}초 후 다시 시작합니다")
+            time.sleep(delay)
+            if not self._stopping:
+                self._spawn()
+        return True
+
+    def stop(self):
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+        self._started_at.clear()
+
+    def memory(self) -> Dict[int, Dict[str, int]]:
+        return {pid: worker_memory(pid) for pid in self.pids}
+
+def main():
+    """메인 함수"""
+    parser = argparse.ArgumentParser(description='Privacy Guard LLM - prefork 멀티프로세스 서버')
+    parser.add_argument('--host', default=config.SERVER_HOST, help='바인드 주소 (기본 localhost)')
+    parser.add_argument('--port', type=int, default=8000, help='포트')
+    parser.add_argument('--workers', type=int, default=config.PREFORK_WORKERS, help='워커 프로세스 수')
+    parser.add_argument('--threads-per-worker', type=int, default=config.PREFORK_THREADS_PER_WORKER,
+                        help='워커당 torch intra-op 스레드 수 (0이면 코어 수 / 워커 수)')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask', help='워커 서버 종류')
+    parser.add_argument('--model-path', default=None, help='NER 모델 경로')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # 부모에서는 OpenMP 스레드 풀을 만들지 않아야 fork 후 워커가 멈추지 않음
+    torch.set_num_threads(1)
+    model_manager = ModelManager(args.model_path, micro_batching=False)
+
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    server = PreforkServer(model_manager, sock, args.workers, args.threads_per_worker or None, args.server)
+
+    print("=" * 60)
+    print("🏥🔒 Privacy Guard LLM Server (prefork)")
+    print("=" * 60)
+    print(f"📡 서버 주소: http://{args.host}:{args.port}")
+    print(f"🍴 워커 {args.workers}개 × torch 스레드 {server.threads_per_worker}개 ({args.server})")
+    print("=" * 60)
+
+    def handle_signal(signum, frame):
+        server.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    server.start()
+    if not server.supervise():
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
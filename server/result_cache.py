@@ -0,0 +1,99 @@
+# server/result_cache.py
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+class SharedResultCache:
+    """같은 호스트의 서버 워커들이 함께 쓰는 SQLite 결과 캐시
+
+    원문은 저장하지 않는다. 키는 (텍스트, 요청별 설정, 모델 버전)의 SHA-256 해시이고,
+    값은 마스킹된 텍스트와 원문 토큰을 뺀 마스킹 로그(위치 포함)뿐이다.
+    """
+
+    TRIM_EVERY = 256  # put 몇 번마다 만료/초과 항목을 정리할지
+
+    def __init__(self, path: str, maxsize: int = 100_000, ttl: float = 3600.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = self.misses = 0
+
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                            key TEXT PRIMARY KEY,
+                            payload TEXT NOT NULL,
+                            expires_at REAL NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """스레드마다 별도 연결 (WAL 모드라 여러 프로세스가 동시에 읽고 쓸 수 있음)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def after_fork(self):
+        """fork된 자식 프로세스에서 호출 (부모의 SQLite 연결을 이어 쓰지 않도록 버림)"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, threshold: int, mode: str, contextual: bool, model_version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (text, str(threshold), mode, str(contextual), model_version):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT payload FROM results WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, payload: Dict[str, Any]):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO results (key, payload, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(payload, ensure_ascii=False), time.time() + self.ttl))
+        with self._lock:
+            self._puts += 1
+            trim = self._puts % self.TRIM_EVERY == 0
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """만료 항목 삭제 후 maxsize를 넘는 만큼 만료가 가까운 것부터 삭제"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            conn.execute("""DELETE FROM results WHERE key IN (
+                                SELECT key FROM results ORDER BY expires_at
+                                LIMIT max(0, (SELECT count(*) FROM results) - ?))""", (self.maxsize,))
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, Any]:
+        size = self._connect().execute("SELECT count(*) FROM results").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'path': self.path, 'size': size, 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}